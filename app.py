@@ -24,12 +24,62 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
     "pool_pre_ping": True,
 }
+# Connection pool per worker; raise it when serving with the optional gevent
+# worker (see wsgi_gevent.py), where hundreds of requests per process share it
+for option, var in (("pool_size", "DB_POOL_SIZE"), ("max_overflow", "DB_MAX_OVERFLOW"),
+                    ("pool_timeout", "DB_POOL_TIMEOUT")):
+    if os.environ.get(var):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"][option] = int(os.environ[var])
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Optional monthly range partitioning of sales/purchases (PostgreSQL only)
+app.config['PARTITION_BY_MONTH'] = os.environ.get('PARTITION_BY_MONTH', '').lower() in ('1', 'true', 'yes')
+app.config['PARTITION_MONTHS_AHEAD'] = int(os.environ.get('PARTITION_MONTHS_AHEAD', 3))
+
 # File upload configuration
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
 
+# Cold storage for closed periods (Parquet files, see archive.py)
+app.config['ARCHIVE_FOLDER'] = os.environ.get('ARCHIVE_FOLDER', 'archive')
+app.config['ARCHIVE_ROW_GROUP_SIZE'] = 5000
+
+# On-the-fly gzip for HTML/JSON responses (see assets.py)
+app.config['GZIP_MIN_SIZE'] = 1024
+app.config['GZIP_LEVEL'] = 6
+
+# Rendered table-row fragments kept per worker, and compiled template cache
+app.config['FRAGMENT_CACHE_SIZE'] = int(os.environ.get('FRAGMENT_CACHE_SIZE', 5000))
+app.config['JINJA_BYTECODE_CACHE_DIR'] = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
+
+# Live updates over /api/events (see events.py)
+app.config['LOW_STOCK_THRESHOLD'] = 10
+app.config['EVENTS_POLL_INTERVAL'] = 2  # seconds, when LISTEN/NOTIFY is unavailable
+app.config['EVENTS_HEARTBEAT'] = 15  # seconds between keep-alive comments
+app.config['EVENTS_STREAM_LIFETIME'] = 300  # seconds before a client is asked to reconnect
+app.config['EVENTS_RETENTION'] = 3600  # seconds of events kept for reconnecting clients
+# Open streams per worker; keep it below gunicorn's --threads so pages still get served
+app.config['EVENTS_MAX_STREAMS'] = int(os.environ.get('EVENTS_MAX_STREAMS', 8))
+
+# Per-worker item catalog cache (see catalog.py)
+app.config['CATALOG_CACHE_SIZE'] = int(os.environ.get('CATALOG_CACHE_SIZE', 50000))
+app.config['CATALOG_CHECK_INTERVAL'] = 5  # seconds between catalog version checks
+
+# Cost of goods sold: 'average' (running weighted average) or 'fifo' (cost layers)
+app.config['COSTING_METHOD'] = os.environ.get('COSTING_METHOD', 'average')
+
+# Default tier for walk-in sales and customers without one (see pricing.py)
+app.config['DEFAULT_PRICE_TIER'] = 'retail'
+
+# Stocktake uploads (see stocktake.py)
+app.config['STOCKTAKE_CHUNK_SIZE'] = 5000  # staged rows per bulk insert
+app.config['STOCKTAKE_REPORT_ROWS'] = 1000  # largest variances listed on the report
+
+# Change feed for downstream sync at /api/changes (see changefeed.py)
+app.config['CHANGES_API_TOKEN'] = os.environ.get('CHANGES_API_TOKEN')
+app.config['CHANGES_PAGE_SIZE'] = 500
+app.config['CHANGES_MAX_PAGE_SIZE'] = 5000
+
 # Initialize the app with the extension
 db.init_app(app)
 
@@ -38,3 +88,12 @@ with app.app_context():
     import models  # noqa: F401
     db.create_all()
     logging.info("Database tables created")
+
+    # create_all() never alters existing tables; add columns introduced since
+    from schema import upgrade_schema
+    upgrade_schema()
+
+    # Make sure the coming months have partitions before rows arrive
+    from partitioning import partitioning_available, ensure_partitions
+    if partitioning_available():
+        ensure_partitions()
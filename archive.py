@@ -0,0 +1,209 @@
+import os
+from datetime import datetime
+from types import SimpleNamespace
+
+import click
+import pandas as pd
+from sqlalchemy import select, update, delete
+
+from app import app, db
+from models import (Customer, Vendor, Item, Sale, SaleItem, Purchase, PurchaseItem,
+                    SalesLedger, PurchaseLedger, ArchivedDocument)
+
+DOCUMENT_TYPES = {
+    'sale': {
+        'model': Sale,
+        'line_model': SaleItem,
+        'ledger': SalesLedger,
+        'parent_key': 'sale_id',
+        'number': 'bill_number',
+        'date': 'sale_date',
+        'party_model': Customer,
+        'party_key': 'customer_id',
+        'party': 'customer',
+        'party_columns': ['name', 'email', 'phone', 'address'],
+    },
+    'purchase': {
+        'model': Purchase,
+        'line_model': PurchaseItem,
+        'ledger': PurchaseLedger,
+        'parent_key': 'purchase_id',
+        'number': 'invoice_number',
+        'date': 'purchase_date',
+        'party_model': Vendor,
+        'party_key': 'vendor_id',
+        'party': 'vendor',
+        'party_columns': ['name', 'email', 'phone', 'address', 'tax_number'],
+    },
+}
+
+ITEM_COLUMNS = ['product', 'sn', 'uom']
+
+# Batch size for the id-based deletes after a period has been written out
+DELETE_CHUNK_SIZE = 1000
+
+
+def _parquet():
+    """Import pyarrow lazily; it is only needed by the archive tier"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Archiving requires pyarrow (pip install pyarrow)")
+    return pyarrow, pyarrow.parquet
+
+
+def archive_paths(doc_type, period):
+    """Header and line-item file paths for one archived period"""
+    spec = DOCUMENT_TYPES[doc_type]
+    folder = app.config['ARCHIVE_FOLDER']
+    return (os.path.join(folder, f"{spec['model'].__tablename__}_{period}.parquet"),
+            os.path.join(folder, f"{spec['line_model'].__tablename__}_{period}.parquet"))
+
+
+def _write_parquet(df, path):
+    pa, pq = _parquet()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Rows are sorted by document number, so row group statistics let the
+    # reader skip straight to the group holding a given number
+    pq.write_table(table, path, compression='zstd',
+                   row_group_size=app.config['ARCHIVE_ROW_GROUP_SIZE'])
+
+
+def archive_documents(doc_type, before, period):
+    """Move documents dated before `before` into Parquet files for period"""
+    spec = DOCUMENT_TYPES[doc_type]
+    model = spec['model']
+    line_model = spec['line_model']
+    party_model = spec['party_model']
+    number_col = getattr(model, spec['number'])
+    date_col = getattr(model, spec['date'])
+
+    header_path, lines_path = archive_paths(doc_type, period)
+    if os.path.exists(header_path) or os.path.exists(lines_path):
+        raise click.ClickException(f"Archive files for {doc_type} {period} already exist")
+
+    header_query = (
+        select(*model.__table__.columns,
+               *[getattr(party_model, col).label(f"{spec['party']}_{col}") for col in spec['party_columns']])
+        .outerjoin(party_model, getattr(model, spec['party_key']) == party_model.id)
+        .where(date_col < before)
+        .order_by(number_col)
+    )
+    # The line tables may carry a copy of the document date for partitioning
+    line_columns = [c for c in line_model.__table__.columns if c.key != spec['date']]
+    lines_query = (
+        select(*line_columns,
+               number_col.label('document_number'),
+               *[getattr(Item, col).label(f"item_{col}") for col in ITEM_COLUMNS])
+        .join(model, getattr(line_model, spec['parent_key']) == model.id)
+        .outerjoin(Item, line_model.item_id == Item.id)
+        .where(date_col < before)
+        .order_by(number_col, line_model.id)
+    )
+
+    with db.engine.connect() as conn:
+        headers = pd.read_sql(header_query, conn, coerce_float=False)
+        lines = pd.read_sql(lines_query, conn, coerce_float=False)
+
+    if headers.empty:
+        return 0
+
+    os.makedirs(app.config['ARCHIVE_FOLDER'], exist_ok=True)
+    _write_parquet(headers, header_path)
+    _write_parquet(lines, lines_path)
+
+    try:
+        ids = [int(value) for value in headers['id']]
+        db.session.bulk_insert_mappings(ArchivedDocument, [
+            {
+                'doc_type': doc_type,
+                'number': row[spec['number']],
+                'original_id': int(row['id']),
+                'document_date': row[spec['date']],
+                'period': period,
+                'file_path': header_path,
+            }
+            for row in headers[['id', spec['number'], spec['date']]].to_dict('records')
+        ])
+
+        ledger = spec['ledger']
+        ledger_key = getattr(ledger, spec['parent_key'])
+        for start in range(0, len(ids), DELETE_CHUNK_SIZE):
+            chunk = ids[start:start + DELETE_CHUNK_SIZE]
+            # Ledger entries stay in the books; only their link goes away
+            db.session.execute(update(ledger).where(ledger_key.in_(chunk)).values({ledger_key: None}))
+            db.session.execute(delete(line_model).where(getattr(line_model, spec['parent_key']).in_(chunk)))
+            db.session.execute(delete(model).where(model.id.in_(chunk)))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        os.remove(header_path)
+        os.remove(lines_path)
+        raise
+
+    return len(ids)
+
+
+def _read_rows(path, column, value):
+    """Read only the rows matching column == value from a Parquet file"""
+    _, pq = _parquet()
+    return pq.read_table(path, filters=[(column, '==', value)]).to_pylist()
+
+
+def load_document(entry):
+    """Rebuild an archived document in the shape the invoice template expects"""
+    spec = DOCUMENT_TYPES[entry.doc_type]
+    _, lines_path = archive_paths(entry.doc_type, entry.period)
+
+    rows = _read_rows(entry.file_path, spec['number'], entry.number)
+    if not rows:
+        return None
+    header = rows[0]
+
+    prefix = f"{spec['party']}_"
+    party = {col: header.pop(prefix + col, None) for col in spec['party_columns']}
+    header[spec['party']] = SimpleNamespace(**party) if party['name'] is not None else None
+
+    items = []
+    for line in _read_rows(lines_path, 'document_number', entry.number):
+        item = {col: line.pop(f"item_{col}", None) for col in ITEM_COLUMNS}
+        line['item'] = SimpleNamespace(id=line['item_id'], **item)
+        items.append(SimpleNamespace(**line))
+    header['items'] = items
+    header['archived'] = True
+
+    return SimpleNamespace(**header)
+
+
+def find_document(doc_type, number=None, original_id=None):
+    """Look up an archived sale or purchase by number or by its original id"""
+    query = ArchivedDocument.query.filter_by(doc_type=doc_type)
+    if number is not None:
+        query = query.filter_by(number=number)
+    else:
+        query = query.filter_by(original_id=original_id)
+    entry = query.first()
+    return load_document(entry) if entry else None
+
+
+@app.cli.group('archive')
+def archive_group():
+    """Move closed periods into cold storage."""
+
+
+@archive_group.command('close')
+@click.option('--before', required=True, type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Archive documents dated before this day (the first day after the closed year).')
+@click.option('--period', help='Label for the archived period, e.g. FY2024.')
+@click.option('--type', 'doc_types', type=click.Choice(list(DOCUMENT_TYPES)), multiple=True,
+              help='Document types to archive (default: all).')
+def close_command(before, period, doc_types):
+    """Archive sales and purchases of a closed period to Parquet."""
+    period = period or f"before-{before:%Y%m%d}"
+    if before > datetime.utcnow():
+        raise click.ClickException('Cannot archive a period that has not ended yet')
+
+    for doc_type in doc_types or DOCUMENT_TYPES:
+        count = archive_documents(doc_type, before, period)
+        click.echo(f"Archived {count} {doc_type} documents to {period}")
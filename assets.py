@@ -0,0 +1,177 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+
+import click
+from flask import request, send_from_directory
+
+from app import app
+
+# Source files under static/ that get a minified, fingerprinted build
+BUILD_ASSETS = ['css/style.css', 'js/main.js']
+
+DIST_FOLDER = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Dynamic responses worth compressing on the fly
+COMPRESSIBLE_MIMETYPES = {'text/html', 'application/json'}
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def minify_css(source):
+    """Strip comments and insignificant whitespace from a stylesheet"""
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+
+def minify_js(source):
+    """Conservatively shrink a script: drop comments, indentation and blank lines"""
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    lines = []
+    in_template = False
+    for line in source.splitlines():
+        if in_template:
+            # Whitespace inside template literals is part of the string
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith('//'):
+                lines.append(stripped)
+        if (line.count('`') - line.count('\\`')) % 2:
+            in_template = not in_template
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def build_assets():
+    """Minify, fingerprint and precompress BUILD_ASSETS into static/dist"""
+    dist = os.path.join(app.static_folder, DIST_FOLDER)
+    shutil.rmtree(dist, ignore_errors=True)
+    brotli = _brotli()
+    manifest = {}
+
+    for name in BUILD_ASSETS:
+        base, ext = os.path.splitext(name)
+        with open(os.path.join(app.static_folder, name), encoding='utf-8') as f:
+            data = MINIFIERS[ext](f.read()).encode('utf-8')
+
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        hashed = f"{DIST_FOLDER}/{base}.{digest}{ext}"
+        path = os.path.join(app.static_folder, hashed)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'wb') as f:
+            f.write(data)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+
+        manifest[name] = hashed
+
+    with open(os.path.join(dist, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def load_manifest():
+    """Read the build manifest; without a build, assets are served as-is"""
+    path = os.path.join(app.static_folder, DIST_FOLDER, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+asset_manifest = load_manifest()
+if asset_manifest:
+    logging.info(f"Serving {len(asset_manifest)} fingerprinted static assets")
+
+
+@app.url_defaults
+def fingerprint_static_url(endpoint, values):
+    # Point url_for('static', ...) at the content-hashed build when there is one
+    if endpoint == 'static' and values.get('filename') in asset_manifest:
+        values['filename'] = asset_manifest[values['filename']]
+
+
+def static_file(filename):
+    if not filename.startswith(DIST_FOLDER + '/'):
+        return app.send_static_file(filename)
+
+    # Fingerprinted files never change, so serve the precompressed variant
+    # the client accepts and let browsers cache it for a year
+    response = None
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.isfile(
+                os.path.join(app.static_folder, filename + suffix)):
+            response = send_from_directory(app.static_folder, filename + suffix,
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = app.send_static_file(filename)
+
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+app.view_functions['static'] = static_file
+
+
+@app.after_request
+def compress_response(response):
+    # Gzip larger HTML/JSON pages; streamed and file responses are left alone
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code in (204, 304)
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'Content-Encoding' in response.headers
+            or not request.accept_encodings['gzip']):
+        return response
+
+    data = response.get_data()
+    if len(data) < app.config['GZIP_MIN_SIZE']:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=app.config['GZIP_LEVEL']))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@app.cli.group()
+def assets():
+    """Build static assets."""
+
+
+@assets.command('build')
+def build_command():
+    """Minify, fingerprint and precompress CSS/JS into static/dist."""
+    manifest = build_assets()
+    for name, hashed in manifest.items():
+        click.echo(f"{name} -> {hashed}")
+    if not _brotli():
+        click.echo('brotli not installed; only gzip variants were written')
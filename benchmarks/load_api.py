@@ -0,0 +1,152 @@
+"""Load-test the JSON API at increasing concurrency.
+
+Signs in, then runs N client threads that request random /api/item/<id>
+lookups back to back for a fixed time at each concurrency level. A probe
+thread loads the dashboard twice a second meanwhile, to show whether
+regular pages stay responsive. Reports throughput and latency
+percentiles. Run it once per server setup and compare, e.g.:
+
+    gunicorn --bind 0.0.0.0:5000 --workers 4 main:app
+    gunicorn --bind 0.0.0.0:5000 --workers 4 --worker-class gevent --worker-connections 500 wsgi_gevent:app
+
+    python benchmarks/load_api.py --url http://127.0.0.1:5000 --concurrency 1,10,50,200 --items 1-1000
+"""
+import argparse
+import http.client
+import random
+import re
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+
+def login(base_url, username, password):
+    """Sign in and return the session Cookie header"""
+    jar = CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    page = opener.open(f"{base_url}/login").read().decode()
+    match = re.search(r'name="csrf_token"[^>]*value="([^"]+)"', page)
+    data = {'username': username, 'password': password}
+    if match:
+        data['csrf_token'] = match.group(1)
+    opener.open(f"{base_url}/login", urllib.parse.urlencode(data).encode())
+    cookies = '; '.join(f"{cookie.name}={cookie.value}" for cookie in jar)
+    if 'session=' not in cookies:
+        raise SystemExit('Login failed')
+    return cookies
+
+
+class Client:
+    """One keep-alive HTTP connection, reopened when the server closes it"""
+
+    def __init__(self, base_url, cookies):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.headers = {'Cookie': cookies, 'Accept-Encoding': 'identity'}
+        self.conn = None
+
+    def get(self, path):
+        """Return (status, seconds); status 0 on connection errors"""
+        start = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.conn.request('GET', path, headers=self.headers)
+            response = self.conn.getresponse()
+            response.read()
+            if response.will_close:
+                self.conn.close()
+                self.conn = None
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+            status = 0
+        return status, time.perf_counter() - start
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_level(args, cookies, concurrency):
+    stop = time.perf_counter() + args.duration
+    latencies = []
+    probe_latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker():
+        client = Client(args.url, cookies)
+        own = []
+        failed = 0
+        while time.perf_counter() < stop:
+            status, elapsed = client.get(f"/api/item/{random.randint(args.first_item, args.last_item)}")
+            if status in (200, 404):
+                own.append(elapsed)
+            else:
+                failed += 1
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+
+    def probe():
+        client = Client(args.url, cookies)
+        while time.perf_counter() < stop:
+            status, elapsed = client.get('/')
+            if status == 200:
+                probe_latencies.append(elapsed)
+            time.sleep(0.5)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    threads.append(threading.Thread(target=probe))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': len(latencies) / wall,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'page_p95': percentile(probe_latencies, 95) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--concurrency', default='1,10,50,200', help='comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per concurrency level')
+    parser.add_argument('--items', default='1-100', help='range of item ids to look up')
+    args = parser.parse_args()
+    args.url = args.url.rstrip('/')
+    args.first_item, args.last_item = (int(part) for part in args.items.split('-'))
+
+    cookies = login(args.url, args.username, args.password)
+
+    print(f"{'clients':>8} {'requests':>9} {'errors':>7} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'page p95':>9}")
+    for concurrency in (int(level) for level in args.concurrency.split(',')):
+        result = run_level(args, cookies, concurrency)
+        print(f"{result['concurrency']:>8} {result['requests']:>9} {result['errors']:>7} {result['rps']:>8.1f} "
+              f"{result['p50']:>8.1f} {result['p95']:>8.1f} {result['p99']:>8.1f} {result['page_p95']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Compare date-range query latency on a plain vs. a monthly partitioned sales table.
+
+Builds both tables in a scratch schema of the PostgreSQL database named by
+DATABASE_URL, fills them with the same synthetic rows and times the
+date-bounded queries the sales screens and reports run.
+
+    DATABASE_URL=postgresql://localhost/bench python benchmarks/partition_benchmark.py --rows 5000000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+
+SCHEMA = 'partition_bench'
+
+QUERIES = {
+    'month total': (
+        "SELECT count(*), sum(total_amount) FROM {table} "
+        "WHERE sale_date >= '{month}' AND sale_date < '{next_month}'"
+    ),
+    'week listing': (
+        "SELECT id, bill_number, total_amount, sale_date FROM {table} "
+        "WHERE sale_date >= '{month}' AND sale_date < '{month}'::timestamp + interval '7 days' "
+        "ORDER BY sale_date DESC LIMIT 100"
+    ),
+    # The margin report's shape: lines joined on id and date, both tables bounded
+    'quarter lines': (
+        "SELECT count(*), sum(l.total_price) FROM {lines} l JOIN {table} s "
+        "ON l.sale_id = s.id AND l.sale_date = s.sale_date "
+        "WHERE s.sale_date >= '{month}' AND s.sale_date < '{month}'::timestamp + interval '3 months' "
+        "AND l.sale_date >= '{month}' AND l.sale_date < '{month}'::timestamp + interval '3 months'"
+    ),
+}
+
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def build(conn, rows, months, start):
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    conn.execute(text(f"SET search_path TO {SCHEMA}"))
+
+    columns = ("id bigint NOT NULL, bill_number text NOT NULL, customer_id int, "
+               "total_amount numeric(10, 2) NOT NULL, sale_date timestamp NOT NULL")
+    line_columns = ("id bigint NOT NULL, sale_id bigint NOT NULL, item_id int NOT NULL, "
+                    "quantity numeric(10, 2), total_price numeric(10, 2), sale_date timestamp NOT NULL")
+
+    conn.execute(text(f"CREATE TABLE sales_plain ({columns}, PRIMARY KEY (id))"))
+    conn.execute(text(f"CREATE TABLE sale_items_plain ({line_columns}, PRIMARY KEY (id))"))
+    conn.execute(text(f"CREATE TABLE sales_part ({columns}, PRIMARY KEY (id, sale_date)) "
+                      f"PARTITION BY RANGE (sale_date)"))
+    conn.execute(text(f"CREATE TABLE sale_items_part ({line_columns}, PRIMARY KEY (id, sale_date)) "
+                      f"PARTITION BY RANGE (sale_date)"))
+    for offset in range(months):
+        lower = add_months(start, offset)
+        upper = add_months(start, offset + 1)
+        for table in ('sales_part', 'sale_items_part'):
+            conn.execute(text(
+                f"CREATE TABLE {table}_{lower:%Y_%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{lower:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+            ))
+
+    span_seconds = int((add_months(start, months) - start).total_seconds()) - 1
+    conn.execute(text(
+        f"INSERT INTO sales_plain SELECT g, 'SALE-' || g, g % 500, (random() * 1000)::numeric(10, 2), "
+        f"'{start:%Y-%m-%d}'::timestamp + (g::bigint * {span_seconds} / {rows}) * interval '1 second' "
+        f"FROM generate_series(1, {rows}) g"
+    ))
+    conn.execute(text(
+        "INSERT INTO sale_items_plain SELECT s.id * 3 + n, s.id, (s.id + n) % 5000, 1, "
+        "s.total_amount / 3, s.sale_date FROM sales_plain s, generate_series(0, 2) n"
+    ))
+    conn.execute(text("INSERT INTO sales_part SELECT * FROM sales_plain"))
+    conn.execute(text("INSERT INTO sale_items_part SELECT * FROM sale_items_plain"))
+
+    for table in ('sales_plain', 'sales_part'):
+        conn.execute(text(f"CREATE INDEX ON {table} (sale_date)"))
+    for table in ('sale_items_plain', 'sale_items_part'):
+        conn.execute(text(f"CREATE INDEX ON {table} (sale_id)"))
+    conn.execute(text("ANALYZE"))
+
+
+def time_query(conn, sql, repeat):
+    timings = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        conn.execute(text(sql)).fetchall()
+        timings.append((time.perf_counter() - began) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5_000_000, help='sales rows (3 lines each)')
+    parser.add_argument('--months', type=int, default=36, help='months of history')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per query')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch schema')
+    args = parser.parse_args()
+
+    url = os.environ.get('DATABASE_URL')
+    if not url or not url.startswith('postgres'):
+        sys.exit('DATABASE_URL must point at a PostgreSQL database')
+
+    engine = create_engine(url)
+    start = add_months(datetime.utcnow().replace(day=1), -args.months + 1)
+    probe_month = add_months(start, args.months // 2)
+
+    with engine.begin() as conn:
+        print(f"Loading {args.rows:,} sales over {args.months} months...")
+        began = time.perf_counter()
+        build(conn, args.rows, args.months, start)
+        print(f"Loaded in {time.perf_counter() - began:.1f}s\n")
+
+    print(f"{'query':<16}{'plain p50':>12}{'plain p95':>12}{'part p50':>12}{'part p95':>12}")
+    with engine.connect() as conn:
+        conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        for name, template in QUERIES.items():
+            results = []
+            for suffix in ('plain', 'part'):
+                sql = template.format(table=f'sales_{suffix}', lines=f'sale_items_{suffix}',
+                                      month=f'{probe_month:%Y-%m-%d}',
+                                      next_month=f'{add_months(probe_month, 1):%Y-%m-%d}')
+                conn.execute(text(sql)).fetchall()  # warm the cache
+                results.extend(time_query(conn, sql, args.repeat))
+            print(f"{name:<16}" + ''.join(f"{ms:>10.2f}ms" for ms in results))
+
+    if not args.keep:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+
+if __name__ == '__main__':
+    main()
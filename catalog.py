@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import select, update, cast, Integer, String
+
+from app import app, db
+from models import Item, Settings
+
+# Settings row bumped by every change to catalog data (prices, names, uom)
+CATALOG_VERSION_KEY = 'catalog_version'
+
+CATALOG_COLUMNS = [Item.id, Item.sn, Item.product, Item.category, Item.uom,
+                   Item.cp, Item.wholesale, Item.sp]
+
+# Keeps IN lists within SQLite's bound-parameter limit
+LOAD_CHUNK_SIZE = 1000
+
+
+class CatalogEntry:
+    """Read-only snapshot of the item fields the sale screens need"""
+    __slots__ = ('id', 'sn', 'product', 'category', 'uom', 'cp', 'wholesale', 'sp')
+
+    def __init__(self, id, sn, product, category, uom, cp, wholesale, sp):
+        self.id = id
+        self.sn = sn
+        self.product = product
+        self.category = category
+        self.uom = uom
+        self.cp = cp
+        self.wholesale = wholesale
+        self.sp = sp
+
+
+def bump_catalog_version():
+    """Mark the catalog as changed; call inside the transaction making the change"""
+    result = db.session.execute(
+        update(Settings)
+        .where(Settings.key == CATALOG_VERSION_KEY)
+        .values(value=cast(cast(Settings.value, Integer) + 1, String), updated_at=datetime.utcnow())
+    )
+    if not result.rowcount:
+        db.session.add(Settings(key=CATALOG_VERSION_KEY, value='1'))
+    # This worker sees its own change right away, the rest on their next check
+    catalog.invalidate()
+
+
+class ItemCatalog:
+    """Per-worker read-through cache of items, indexed by id and by sn.
+
+    Entries are evicted least recently used beyond maxsize. The whole cache
+    is dropped when the catalog version in the settings table moves, which
+    each worker checks at most once every check_interval seconds.
+    """
+
+    def __init__(self, maxsize, check_interval):
+        self.maxsize = maxsize
+        self.check_interval = check_interval
+        self._by_id = OrderedDict()
+        self._by_sn = {}
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._by_id.clear()
+            self._by_sn.clear()
+            self._version = None
+            self._checked_at = 0
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        version = db.session.execute(
+            select(Settings.value).where(Settings.key == CATALOG_VERSION_KEY)
+        ).scalar()
+        with self._lock:
+            if version != self._version:
+                self._by_id.clear()
+                self._by_sn.clear()
+                self._version = version
+            self._checked_at = now
+
+    def version(self):
+        """Current catalog version, for caches derived from catalog data"""
+        self._check_version()
+        return self._version
+
+    def _store(self, rows):
+        entries = [CatalogEntry(*row) for row in rows]
+        with self._lock:
+            for entry in entries:
+                self._by_id[entry.id] = entry
+                self._by_id.move_to_end(entry.id)
+                self._by_sn[entry.sn] = entry
+            while len(self._by_id) > self.maxsize:
+                _, evicted = self._by_id.popitem(last=False)
+                if self._by_sn.get(evicted.sn) is evicted:
+                    del self._by_sn[evicted.sn]
+        return entries
+
+    def get_many(self, ids):
+        """Return {id: entry} for ids, loading all misses in one query"""
+        self._check_version()
+        found = {}
+        missing = []
+        with self._lock:
+            for item_id in ids:
+                entry = self._by_id.get(item_id)
+                if entry is None:
+                    missing.append(item_id)
+                else:
+                    self._by_id.move_to_end(item_id)
+                    found[item_id] = entry
+        for start in range(0, len(missing), LOAD_CHUNK_SIZE):
+            chunk = missing[start:start + LOAD_CHUNK_SIZE]
+            rows = db.session.execute(select(*CATALOG_COLUMNS).where(Item.id.in_(chunk))).all()
+            for entry in self._store(rows):
+                found[entry.id] = entry
+        return found
+
+    def get(self, item_id):
+        return self.get_many([item_id]).get(item_id)
+
+    def get_by_sn(self, sn):
+        self._check_version()
+        with self._lock:
+            entry = self._by_sn.get(sn)
+            if entry is not None and entry.id in self._by_id:
+                self._by_id.move_to_end(entry.id)
+                return entry
+        rows = db.session.execute(select(*CATALOG_COLUMNS).where(Item.sn == sn)).all()
+        entries = self._store(rows)
+        return entries[0] if entries else None
+
+
+catalog = ItemCatalog(app.config['CATALOG_CACHE_SIZE'], app.config['CATALOG_CHECK_INTERVAL'])
+
+
+def in_stock_items():
+    """(catalog entry, current quantity) pairs for every item in stock"""
+    stock = db.session.execute(
+        select(Item.id, Item.current_quantity).where(Item.current_quantity > 0).order_by(Item.id)
+    ).all()
+    entries = catalog.get_many([row.id for row in stock])
+    return [(entries[row.id], row.current_quantity) for row in stock if row.id in entries]
@@ -0,0 +1,210 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import click
+from sqlalchemy import select, delete, exists, insert, text, literal, literal_column, tuple_, or_, and_
+from sqlalchemy.orm import aliased
+
+from app import app, db
+from models import ChangeLog, Customer, Vendor, Item, Sale, SaleItem, Purchase, PurchaseItem
+
+# Tables published on the feed, with the line items nested into each document
+TRACKED_TABLES = {
+    'items': (Item, None),
+    'customers': (Customer, None),
+    'vendors': (Vendor, None),
+    'sales': (Sale, SaleItem.sale_id),
+    'purchases': (Purchase, PurchaseItem.purchase_id),
+}
+
+# Oldest transaction still running when the statement started. Rows of
+# earlier transactions are final, so readers never go past it and a
+# cursor cannot skip over a transaction that commits late.
+PG_HORIZON = literal_column("pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+
+COMPACT_BATCH_SIZE = 10000
+
+
+def _transaction_state():
+    """(transaction id, keys already logged) for the current transaction.
+
+    SQLite has a single writer, so its entry ids are already in commit
+    order and every entry gets transaction id 0.
+    """
+    session = db.session()
+    transaction = session.get_transaction() or session.begin()
+    state = session.info.get('changefeed')
+    if state is None or state[0] is not transaction:
+        txid = 0
+        if db.engine.dialect.name == 'postgresql':
+            txid = session.execute(text("SELECT pg_current_xact_id()::text::bigint")).scalar()
+        state = (transaction, txid, set())
+        session.info['changefeed'] = state
+    return state[1], state[2]
+
+
+def transaction_id():
+    """Id of the current transaction, stored with rows read by (txid, id) cursors"""
+    return _transaction_state()[0]
+
+
+def committed_after(model, cursor):
+    """Conditions for rows of model after cursor, a (txid, id) pair, whose
+    position can no longer be taken by a transaction still running"""
+    txid, row_id = cursor
+    conditions = [tuple_(model.txid, model.id) >
+                  tuple_(literal(txid, model.txid.type), literal(row_id, model.id.type))]
+    if db.engine.dialect.name == 'postgresql':
+        conditions.append(model.txid < PG_HORIZON)
+    return conditions
+
+
+def record(obj, op='upsert'):
+    """Log a change to a tracked row in the current transaction.
+
+    Call before deleting the row. Only the key is stored; the feed serves
+    the row as it is when read, so repeated changes collapse to one.
+    """
+    if obj.id is None:
+        db.session.flush()
+    key = (obj.__tablename__, obj.id, op)
+    txid, seen = _transaction_state()
+    if key not in seen:
+        seen.add(key)
+        db.session.add(ChangeLog(txid=txid, table_name=obj.__tablename__, row_id=obj.id, op=op))
+
+
+def record_many(table_name, row_ids, op='upsert'):
+    """Log changes to many rows of one table with a single bulk insert"""
+    txid, seen = _transaction_state()
+    rows = []
+    for row_id in row_ids:
+        key = (table_name, row_id, op)
+        if key not in seen:
+            seen.add(key)
+            rows.append({'txid': txid, 'table_name': table_name, 'row_id': row_id, 'op': op,
+                         'created_at': datetime.utcnow()})
+    if rows:
+        db.session.execute(insert(ChangeLog), rows)
+
+
+def _jsonable(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _rows(table, ids):
+    return {row['id']: {key: _jsonable(value) for key, value in row.items()}
+            for row in db.session.execute(select(table).where(table.c.id.in_(ids))).mappings()}
+
+
+def _load(table_name, ids):
+    """Current state of the given rows of one table, in at most two queries"""
+    model, parent_column = TRACKED_TABLES[table_name]
+    rows = _rows(model.__table__, ids)
+    if parent_column is not None and rows:
+        for row in rows.values():
+            row['items'] = []
+        lines = db.session.execute(select(parent_column.table).where(parent_column.in_(rows))).mappings()
+        for line in lines:
+            rows[line[parent_column.key]]['items'].append(
+                {key: _jsonable(value) for key, value in line.items()})
+    return rows
+
+
+def parse_cursor(value):
+    """(txid, id) from a cursor string; a bare id is an entry logged before
+    transaction ids were recorded. Raises ValueError."""
+    txid, _, entry_id = str(value).rpartition('-')
+    return int(txid or 0), int(entry_id)
+
+
+def format_cursor(txid, entry_id):
+    return f"{txid}-{entry_id}"
+
+
+def read_changes(since, limit):
+    """One page of the feed after the cursor `since`, a (txid, id) pair.
+
+    Returns (changes, next cursor, more). Entries are read in (transaction
+    id, id) order. Each row appears once per page with its current data, at
+    the position of its latest change. On PostgreSQL that order is not
+    commit order, so a delete in the page wins over a later upsert (serial
+    ids are never reused there); on SQLite the latest entry wins, as ids
+    of deleted rows can be handed out again.
+    """
+    entries = db.session.execute(
+        select(ChangeLog.id, ChangeLog.txid, ChangeLog.table_name, ChangeLog.row_id, ChangeLog.op)
+        .where(*committed_after(ChangeLog, since))
+        .order_by(ChangeLog.txid, ChangeLog.id)
+        .limit(limit)
+    ).all()
+    if not entries:
+        return [], format_cursor(*since), False
+
+    delete_wins = db.engine.dialect.name == 'postgresql'
+    latest = {}
+    for entry in entries:
+        key = (entry.table_name, entry.row_id)
+        if delete_wins and key in latest and latest[key].op == 'delete':
+            continue
+        latest.pop(key, None)
+        latest[key] = entry
+
+    ids_by_table = {}
+    for (table_name, row_id), entry in latest.items():
+        if entry.op != 'delete':
+            ids_by_table.setdefault(table_name, []).append(row_id)
+    current = {table_name: _load(table_name, ids) for table_name, ids in ids_by_table.items()
+               if table_name in TRACKED_TABLES}
+
+    changes = []
+    for (table_name, row_id), entry in latest.items():
+        change = {'id': entry.id, 'table': table_name, 'key': row_id, 'op': entry.op}
+        if entry.op != 'delete':
+            change['data'] = current.get(table_name, {}).get(row_id)
+            if change['data'] is None:
+                # Deleted (its delete entry is in another page) or archived
+                continue
+        changes.append(change)
+
+    last = entries[-1]
+    return changes, format_cursor(last.txid, last.id), len(entries) == limit
+
+
+def compact():
+    """Delete upserts superseded by a later change to the same row in feed order.
+
+    Deletes are kept: a row's delete can be ordered before its last upsert
+    when the deleting transaction started first.
+    """
+    newer = aliased(ChangeLog)
+    superseded = (select(ChangeLog.id)
+                  .where(ChangeLog.op != 'delete',
+                         exists().where(newer.table_name == ChangeLog.table_name,
+                                        newer.row_id == ChangeLog.row_id,
+                                        or_(newer.txid > ChangeLog.txid,
+                                            and_(newer.txid == ChangeLog.txid, newer.id > ChangeLog.id))))
+                  .limit(COMPACT_BATCH_SIZE))
+    removed = 0
+    while True:
+        ids = db.session.execute(superseded).scalars().all()
+        if not ids:
+            return removed
+        db.session.execute(delete(ChangeLog).where(ChangeLog.id.in_(ids)))
+        db.session.commit()
+        removed += len(ids)
+
+
+@app.cli.group()
+def changes():
+    """Maintain the change feed."""
+
+
+@changes.command('compact')
+def compact_command():
+    """Delete change log entries superseded by a later change to the same row."""
+    click.echo(f"Removed {compact()} superseded change log entries")
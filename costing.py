@@ -0,0 +1,124 @@
+from datetime import datetime
+from decimal import Decimal
+
+from app import app, db
+from models import CostLayer, Item
+
+# Every function here must run *before* the caller changes
+# item.current_quantity, since costs are weighted by the stock on hand.
+
+COST_PLACES = Decimal('0.0001')
+AMOUNT_PLACES = Decimal('0.01')
+
+
+def fifo_enabled():
+    return app.config['COSTING_METHOD'] == 'fifo'
+
+
+def lock_items(item_ids):
+    """Load items for a stock and cost change as {id: item}, locking their rows.
+
+    Rows are locked in id order so concurrent postings queue up instead of
+    deadlocking, and each one weighs its cost against the quantity the
+    previous one left. Already loaded items are refreshed.
+    """
+    items = (Item.query.filter(Item.id.in_(set(item_ids))).order_by(Item.id)
+             .with_for_update().populate_existing())
+    return {item.id: item for item in items}
+
+
+def current_cost(item):
+    """Running average cost of an item; the static cost price until stock is received"""
+    return Decimal(item.avg_cost if item.avg_cost is not None else item.cp or 0)
+
+
+def _on_hand(item):
+    return max(Decimal(item.current_quantity or 0), Decimal('0'))
+
+
+def _seed_opening_layer(item):
+    """Value stock that predates any layer (opening quantity) at the current cost"""
+    on_hand = _on_hand(item)
+    if on_hand and not CostLayer.query.filter_by(item_id=item.id).first():
+        db.session.add(CostLayer(item_id=item.id, received_at=item.created_at or datetime.utcnow(),
+                                 unit_cost=current_cost(item), quantity=on_hand, remaining=on_hand))
+
+
+def receive(item, quantity, unit_cost, purchase_id=None):
+    """Post a receipt of quantity units at unit_cost into the item's cost"""
+    quantity = Decimal(quantity)
+    unit_cost = Decimal(unit_cost)
+    on_hand = _on_hand(item)
+
+    if fifo_enabled():
+        _seed_opening_layer(item)
+        db.session.add(CostLayer(item_id=item.id, purchase_id=purchase_id, unit_cost=unit_cost,
+                                 quantity=quantity, remaining=quantity))
+
+    total = on_hand + quantity
+    if total > 0:
+        item.avg_cost = ((on_hand * current_cost(item) + quantity * unit_cost) / total).quantize(COST_PLACES)
+    else:
+        item.avg_cost = unit_cost
+
+
+def _consume(layers, quantity):
+    """Take quantity units out of layers in order; returns (cost taken, units short)"""
+    cost = Decimal('0')
+    for layer in layers:
+        if not quantity:
+            break
+        taken = min(layer.remaining, quantity)
+        layer.remaining -= taken
+        cost += taken * layer.unit_cost
+        quantity -= taken
+    return cost, quantity
+
+
+def _open_layers(item):
+    return (CostLayer.query
+            .filter(CostLayer.item_id == item.id, CostLayer.remaining > 0)
+            .order_by(CostLayer.received_at, CostLayer.id)
+            .with_for_update())
+
+
+def issue(item, quantity):
+    """Take quantity units out of stock and return their unit cost"""
+    quantity = Decimal(quantity)
+    if not fifo_enabled() or quantity <= 0:
+        return current_cost(item).quantize(COST_PLACES)
+
+    _seed_opening_layer(item)
+    cost, short = _consume(_open_layers(item), quantity)
+    # Selling into negative stock: cost the shortfall at the running average
+    cost += short * current_cost(item)
+
+    return (cost / quantity).quantize(COST_PLACES)
+
+
+def reverse_issue(item, quantity, unit_cost):
+    """Put units from a deleted sale back into stock at the cost they left with"""
+    receive(item, quantity, unit_cost if unit_cost is not None else current_cost(item))
+
+
+def reverse_receipt(item, quantity, unit_cost, purchase_id):
+    """Take a deleted purchase's units back out of the item's cost"""
+    quantity = Decimal(quantity)
+    unit_cost = Decimal(unit_cost)
+
+    if fifo_enabled():
+        # Units of the purchase already sold stay sold at their cost; the
+        # rest of the quantity comes out of the oldest remaining stock
+        own = CostLayer.query.filter_by(item_id=item.id, purchase_id=purchase_id).with_for_update()
+        _, short = _consume(own, quantity)
+        _consume(_open_layers(item), short)
+
+    on_hand = _on_hand(item)
+    remaining = on_hand - quantity
+    if remaining > 0:
+        value = on_hand * current_cost(item) - quantity * unit_cost
+        item.avg_cost = max(value / remaining, Decimal('0')).quantize(COST_PLACES)
+
+
+def line_cost(quantity, unit_cost):
+    return (Decimal(quantity) * unit_cost).quantize(AMOUNT_PLACES)
@@ -0,0 +1,213 @@
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text, insert
+
+from app import app, db
+from models import AppEvent
+from changefeed import PG_HORIZON, transaction_id, committed_after, format_cursor
+
+# NOTIFY channel used to wake listeners in every gunicorn worker
+EVENTS_CHANNEL = 'app_events'
+
+# Events kept per subscriber before a slow client is dropped (it reconnects
+# with Last-Event-ID and catches up from the table)
+SUBSCRIBER_QUEUE_SIZE = 500
+
+FETCH_BATCH_SIZE = 500
+
+
+def publish(kind, **payload):
+    """Record an event in the current transaction; it goes out when the transaction commits"""
+    db.session.add(AppEvent(txid=transaction_id(), kind=kind, payload=json.dumps(payload, default=str)))
+    if db.engine.dialect.name == 'postgresql':
+        # Delivered only on commit, and collapsed to one per transaction
+        db.session.execute(text("SELECT pg_notify(:channel, '')"), {'channel': EVENTS_CHANNEL})
+
+
+def publish_many(kind, payloads):
+    """Record many events of one kind with a single bulk insert"""
+    if not payloads:
+        return
+    txid = transaction_id()
+    db.session.execute(insert(AppEvent), [{'txid': txid, 'kind': kind, 'payload': json.dumps(payload, default=str),
+                                           'created_at': datetime.utcnow()} for payload in payloads])
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text("SELECT pg_notify(:channel, '')"), {'channel': EVENTS_CHANNEL})
+
+
+def publish_stock(item):
+    """Announce an item's new stock level, and a low-stock alert if needed"""
+    quantity = float(item.current_quantity or 0)
+    publish('stock', item_id=item.id, product=item.product, current_quantity=quantity, uom=item.uom)
+    if quantity < app.config['LOW_STOCK_THRESHOLD']:
+        publish('low_stock', item_id=item.id, product=item.product, current_quantity=quantity, uom=item.uom)
+
+
+def format_event(cursor, kind, payload):
+    return f"id: {format_cursor(*cursor)}\nevent: {kind}\ndata: {payload}\n\n"
+
+
+def events_after(conn, cursor, limit):
+    """Committed events after cursor, a (txid, id) pair, as ((txid, id), kind, payload)"""
+    rows = conn.execute(
+        db.select(AppEvent.txid, AppEvent.id, AppEvent.kind, AppEvent.payload)
+        .where(*committed_after(AppEvent, cursor))
+        .order_by(AppEvent.txid, AppEvent.id)
+        .limit(limit)
+    ).all()
+    return [((row.txid, row.id), row.kind, row.payload) for row in rows]
+
+
+class Subscriber(queue.Queue):
+    """Events waiting for one stream; closed once it falls too far behind.
+
+    A subclass, because gevent's patched Queue takes no new attributes.
+    """
+    closed = False
+
+
+class EventBroker:
+    """Per-process fan-out of committed events to the open SSE streams.
+
+    Events are read in (txid, id) order and, on PostgreSQL, only once every
+    older transaction has finished (see changefeed.committed_after), so an
+    event whose transaction commits late is never skipped.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._cursor = None
+        self._last_prune = 0
+
+    def subscribe(self):
+        """A new Subscriber, or None if this worker already has
+        EVENTS_MAX_STREAMS open streams"""
+        subscriber = Subscriber(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if len(self._subscribers) >= app.config['EVENTS_MAX_STREAMS']:
+                return None
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='event-broker', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _dispatch(self, rows):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            for row in rows:
+                try:
+                    subscriber.put_nowait(row)
+                except queue.Full:
+                    subscriber.closed = True
+                    self.unsubscribe(subscriber)
+                    break
+
+    def _fetch(self):
+        """Dispatch new events; returns True if some wait on an older transaction"""
+        with db.engine.connect() as conn:
+            if self._cursor is None:
+                # Start after the last deliverable event
+                last = conn.execute(
+                    db.select(AppEvent.txid, AppEvent.id)
+                    .where(*committed_after(AppEvent, (-1, 0)))
+                    .order_by(AppEvent.txid.desc(), AppEvent.id.desc())
+                    .limit(1)
+                ).first()
+                self._cursor = tuple(last) if last else (0, 0)
+            while True:
+                rows = events_after(conn, self._cursor, FETCH_BATCH_SIZE)
+                if not rows:
+                    break
+                self._cursor = rows[-1][0]
+                self._dispatch(rows)
+            waiting = conn.dialect.name == 'postgresql' and conn.execute(
+                db.select(AppEvent.id).where(AppEvent.txid >= PG_HORIZON).limit(1)
+            ).first() is not None
+
+            # Old events are only needed by clients reconnecting shortly after
+            if time.monotonic() - self._last_prune > 60:
+                cutoff = datetime.utcnow() - timedelta(seconds=app.config['EVENTS_RETENTION'])
+                conn.execute(text("DELETE FROM app_events WHERE created_at < :cutoff"), {'cutoff': cutoff})
+                conn.commit()
+                self._last_prune = time.monotonic()
+        return waiting
+
+    def _listen(self):
+        """Block on LISTEN/NOTIFY; the periodic fetch is a safety net"""
+        raw = db.engine.raw_connection()
+        try:
+            connection = raw.driver_connection
+            connection.autocommit = True
+            connection.cursor().execute(f"LISTEN {EVENTS_CHANNEL}")
+            waiting = self._fetch()
+            while True:
+                # Events held back by an older transaction go out once it ends,
+                # which may not send a notification of its own
+                timeout = app.config['EVENTS_POLL_INTERVAL'] if waiting else 30
+                if select.select([connection], [], [], timeout) != ([], [], []):
+                    connection.poll()
+                    connection.notifies.clear()
+                waiting = self._fetch()
+        finally:
+            raw.invalidate()
+
+    def _poll(self):
+        while True:
+            self._fetch()
+            time.sleep(app.config['EVENTS_POLL_INTERVAL'])
+
+    def _run(self):
+        with app.app_context():
+            while True:
+                try:
+                    if db.engine.dialect.name == 'postgresql':
+                        self._listen()
+                    else:
+                        self._poll()
+                except Exception:
+                    logging.exception("Event broker failed; retrying")
+                    time.sleep(5)
+
+
+broker = EventBroker()
+
+
+def event_stream(subscriber, last_event_id=None):
+    """Yield server-sent events for a subscriber from broker.subscribe(),
+    replaying anything after last_event_id, a (txid, id) cursor, first"""
+    try:
+        yield f"retry: {int(app.config['EVENTS_POLL_INTERVAL'] * 1000)}\n\n"
+
+        replayed = last_event_id or (-1, 0)
+        if last_event_id:
+            for cursor, kind, payload in events_after(db.session, last_event_id, SUBSCRIBER_QUEUE_SIZE):
+                replayed = cursor
+                yield format_event(cursor, kind, payload)
+        # Don't hold a pooled connection for the life of the stream
+        db.session.remove()
+
+        deadline = time.monotonic() + app.config['EVENTS_STREAM_LIFETIME']
+        while not subscriber.closed and time.monotonic() < deadline:
+            try:
+                cursor, kind, payload = subscriber.get(timeout=app.config['EVENTS_HEARTBEAT'])
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if cursor > replayed:
+                yield format_event(cursor, kind, payload)
+    finally:
+        broker.unsubscribe(subscriber)
@@ -15,6 +15,7 @@ class CustomerForm(FlaskForm):
     phone = StringField('Phone', validators=[Optional()])
     address = TextAreaField('Address', validators=[Optional()])
     balance = DecimalField('Balance', validators=[Optional()], default=Decimal('0.00'))
+    price_tier = SelectField('Price Tier', choices=[('retail', 'Retail'), ('wholesale', 'Wholesale')], default='retail')
 
 class VendorForm(FlaskForm):
     name = StringField('Name', validators=[DataRequired()])
@@ -41,6 +42,10 @@ class ItemForm(FlaskForm):
 class ExcelUploadForm(FlaskForm):
     file = FileField('Excel File', validators=[DataRequired(), FileAllowed(['xlsx', 'xls'], 'Excel files only!')])
 
+class StocktakeUploadForm(FlaskForm):
+    name = StringField('Name', validators=[DataRequired()])
+    file = FileField('Count Sheet', validators=[DataRequired(), FileAllowed(['csv', 'xlsx', 'xls'], 'CSV or Excel files only!')])
+
 class SaleItemForm(FlaskForm):
     item_id = SelectField('Item', coerce=int, validators=[DataRequired()])
     quantity = DecimalField('Quantity', validators=[DataRequired(), NumberRange(min=0.01)])
@@ -82,6 +87,27 @@ class SettingsForm(FlaskForm):
     company_phone = StringField('Company Phone', validators=[Optional()])
     company_email = StringField('Company Email', validators=[Optional(), Email()])
 
+class PriceListForm(FlaskForm):
+    name = StringField('Name', validators=[DataRequired()])
+    tier = SelectField('Tier', choices=[('', 'All Tiers'), ('retail', 'Retail'), ('wholesale', 'Wholesale')], default='')
+    active = BooleanField('Active', default=True)
+
+class PriceRuleForm(FlaskForm):
+    price_list_id = SelectField('Price List', coerce=int, validators=[DataRequired()])
+    item_id = SelectField('Item', coerce=int, validators=[Optional()])
+    category = StringField('Category', validators=[Optional()])
+    min_quantity = DecimalField('Minimum Quantity', validators=[DataRequired(), NumberRange(min=0)], default=Decimal('1'))
+    price = DecimalField('Fixed Price', validators=[Optional(), NumberRange(min=0)])
+    discount_rate = DecimalField('Discount (%)', validators=[Optional(), NumberRange(min=0, max=100)])
+    
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+        if self.price.data is None and self.discount_rate.data is None:
+            self.price.errors.append('Enter a fixed price or a discount')
+            return False
+        return True
+
 class ReportFilterForm(FlaskForm):
     start_date = DateField('Start Date', validators=[DataRequired()])
     end_date = DateField('End Date', validators=[DataRequired()])
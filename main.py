@@ -1,5 +1,8 @@
 from app import app
 import routes  # noqa: F401
+import partitioning  # noqa: F401
+import assets  # noqa: F401
+import template_cache  # noqa: F401
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
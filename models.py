@@ -24,7 +24,9 @@ class Customer(db.Model):
     phone = db.Column(db.String(20))
     address = db.Column(db.Text)
     balance = db.Column(Numeric(10, 2), default=0.00)
+    price_tier = db.Column(db.String(20), default='retail')  # retail, wholesale
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Vendor(db.Model):
     __tablename__ = 'vendors'
@@ -53,7 +55,9 @@ class Item(db.Model):
     uom = db.Column(db.String(20), nullable=False)  # Unit of Measure
     opening_quantity = db.Column(Numeric(10, 2), default=0.00)
     current_quantity = db.Column(Numeric(10, 2), default=0.00)
+    avg_cost = db.Column(Numeric(12, 4))  # Running weighted-average cost, falls back to cp
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Sale(db.Model):
     __tablename__ = 'sales'
@@ -87,6 +91,10 @@ class SaleItem(db.Model):
     total_price = db.Column(Numeric(10, 2), nullable=False)
     vat_enabled = db.Column(db.Boolean, default=False)
     excise_enabled = db.Column(db.Boolean, default=False)
+    unit_cost = db.Column(Numeric(12, 4))  # COGS per unit, stamped when the sale posts
+    cost_amount = db.Column(Numeric(10, 2))
+    # Copy of Sale.sale_date, only written when tables are partitioned by month
+    sale_date = db.deferred(db.Column(db.DateTime))
     
     item = db.relationship('Item')
 
@@ -122,6 +130,8 @@ class PurchaseItem(db.Model):
     total_price = db.Column(Numeric(10, 2), nullable=False)
     vat_enabled = db.Column(db.Boolean, default=False)
     excise_enabled = db.Column(db.Boolean, default=False)
+    # Copy of Purchase.purchase_date, only written when tables are partitioned by month
+    purchase_date = db.deferred(db.Column(db.DateTime))
     
     item = db.relationship('Item')
 
@@ -152,3 +162,111 @@ class Settings(db.Model):
     value = db.Column(db.String(200), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ArchivedDocument(db.Model):
+    __tablename__ = 'archived_documents'
+    __table_args__ = (
+        db.UniqueConstraint('doc_type', 'number'),
+        db.Index('ix_archived_documents_original', 'doc_type', 'original_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    doc_type = db.Column(db.String(20), nullable=False)  # sale, purchase
+    number = db.Column(db.String(50), nullable=False)
+    original_id = db.Column(db.Integer, nullable=False)
+    document_date = db.Column(db.DateTime)
+    period = db.Column(db.String(50), nullable=False)
+    file_path = db.Column(db.String(255), nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DocumentNumber(db.Model):
+    # Keeps bill and invoice numbers unique across monthly partitions, whose
+    # own unique constraints can only cover one month (see partitioning.py)
+    __tablename__ = 'document_numbers'
+    doc_type = db.Column(db.String(20), primary_key=True)  # sale, purchase
+    number = db.Column(db.String(50), primary_key=True)
+
+class AppEvent(db.Model):
+    __tablename__ = 'app_events'
+    __table_args__ = (
+        db.Index('ix_app_events_cursor', 'txid', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    # Publishing transaction's id, delivered in (txid, id) order like the change log
+    txid = db.Column(db.BigInteger, nullable=False, default=0)
+    kind = db.Column(db.String(30), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class CostLayer(db.Model):
+    __tablename__ = 'cost_layers'
+    __table_args__ = (
+        db.Index('ix_cost_layers_item_received', 'item_id', 'received_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False)
+    # No foreign key: purchases may be partitioned or archived
+    purchase_id = db.Column(db.Integer, index=True)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    unit_cost = db.Column(Numeric(12, 4), nullable=False)
+    quantity = db.Column(Numeric(10, 2), nullable=False)
+    remaining = db.Column(Numeric(10, 2), nullable=False)
+
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        db.Index('ix_change_log_key', 'table_name', 'row_id', 'id'),
+        db.Index('ix_change_log_cursor', 'txid', 'id'),
+    )
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    # Writing transaction's id on PostgreSQL (0 on SQLite); the feed is read in (txid, id) order
+    txid = db.Column(db.BigInteger, nullable=False, default=0)
+    table_name = db.Column(db.String(30), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # upsert, delete
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PriceList(db.Model):
+    __tablename__ = 'price_lists'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    tier = db.Column(db.String(20))  # retail, wholesale; empty for every tier
+    active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    rules = db.relationship('PriceRule', backref='price_list', cascade='all, delete-orphan',
+                            order_by='PriceRule.min_quantity')
+
+class PriceRule(db.Model):
+    __tablename__ = 'price_rules'
+    id = db.Column(db.Integer, primary_key=True)
+    price_list_id = db.Column(db.Integer, db.ForeignKey('price_lists.id'), nullable=False, index=True)
+    # Applies to one item, to a category, or to every item when both are empty
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id', ondelete='CASCADE'))
+    category = db.Column(db.String(50))
+    min_quantity = db.Column(Numeric(10, 2), nullable=False, default=1)
+    price = db.Column(Numeric(10, 2))  # Fixed unit price
+    discount_rate = db.Column(Numeric(5, 2))  # Percent off the tier price
+    
+    item = db.relationship('Item')
+
+class Stocktake(db.Model):
+    __tablename__ = 'stocktakes'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), default='draft')  # draft, applied
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    applied_at = db.Column(db.DateTime)
+
+class StocktakeLine(db.Model):
+    __tablename__ = 'stocktake_lines'
+    __table_args__ = (
+        db.UniqueConstraint('stocktake_id', 'sn'),
+        db.Index('ix_stocktake_lines_item', 'stocktake_id', 'item_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    stocktake_id = db.Column(db.Integer, db.ForeignKey('stocktakes.id', ondelete='CASCADE'), nullable=False)
+    sn = db.Column(db.String(50), nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id', ondelete='SET NULL'))  # Matched on upload
+    counted_quantity = db.Column(Numeric(10, 2), nullable=False)
+    system_quantity = db.Column(Numeric(10, 2))  # Stock on hand when the count was applied
+    skip = db.Column(db.Boolean, default=False, nullable=False)
@@ -0,0 +1,257 @@
+import logging
+from datetime import datetime
+
+import click
+from sqlalchemy import event, insert, text
+
+from app import app, db
+from models import Sale, SaleItem, Purchase, PurchaseItem, DocumentNumber
+
+# Each partitioned document table and its line-item table share the
+# document date as partition key, so a date-bounded query prunes both.
+PARTITIONED_TABLES = [
+    {
+        'parent': 'sales',
+        'child': 'sale_items',
+        'date_column': 'sale_date',
+        'number_column': 'bill_number',
+        'parent_key': 'sale_id',
+        'doc_type': 'sale',
+        'references': [('customer_id', 'customers')],
+    },
+    {
+        'parent': 'purchases',
+        'child': 'purchase_items',
+        'date_column': 'purchase_date',
+        'number_column': 'invoice_number',
+        'parent_key': 'purchase_id',
+        'doc_type': 'purchase',
+        'references': [('vendor_id', 'vendors')],
+    },
+]
+
+# Serializes partition DDL between gunicorn workers starting up together
+PARTITION_LOCK_ID = 726001
+
+
+def partitioning_available():
+    """Return True when monthly partitioning is enabled and supported"""
+    return app.config.get('PARTITION_BY_MONTH') and db.engine.dialect.name == 'postgresql'
+
+
+def month_start(value):
+    """Return the first instant of the month containing value"""
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    """Return the first day of the month `months` after value's month"""
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, start):
+    """Name of the monthly partition of table starting at start"""
+    return f"{table}_p{start.year:04d}_{start.month:02d}"
+
+
+def is_partitioned(conn, table):
+    """Check whether table is already a partitioned table"""
+    return conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:name)"),
+        {'name': table}
+    ).scalar() is not None
+
+
+def create_month_partition(conn, table, start):
+    """Create the partition of table covering the month beginning at start"""
+    end = add_months(start, 1)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, start)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    ))
+
+
+def ensure_partitions(months_ahead=None):
+    """Create monthly partitions from the current month up to months_ahead"""
+    if months_ahead is None:
+        months_ahead = app.config.get('PARTITION_MONTHS_AHEAD', 3)
+
+    current = month_start(datetime.utcnow())
+    created = 0
+
+    with db.engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {'id': PARTITION_LOCK_ID})
+        for spec in PARTITIONED_TABLES:
+            for table in (spec['parent'], spec['child']):
+                if not is_partitioned(conn, table):
+                    continue
+                for offset in range(months_ahead + 1):
+                    start = add_months(current, offset)
+                    # Rows already routed to the default partition would
+                    # overlap the new range, so leave those months alone
+                    overlap = conn.execute(text(
+                        f"SELECT 1 FROM {table}_default WHERE {spec['date_column']} >= :start "
+                        f"AND {spec['date_column']} < :end LIMIT 1"
+                    ), {'start': start, 'end': add_months(start, 1)}).scalar()
+                    if overlap:
+                        logging.warning(f"Rows for {start:%Y-%m} are in {table}_default; "
+                                        f"partition not created")
+                        continue
+                    create_month_partition(conn, table, start)
+                    created += 1
+
+    return created
+
+
+def migrate_table(conn, spec, months_ahead):
+    """Convert one document table and its line items to monthly partitions"""
+    parent = spec['parent']
+    child = spec['child']
+    date_col = spec['date_column']
+    number_col = spec['number_column']
+    parent_key = spec['parent_key']
+
+    conn.execute(text(f"LOCK TABLE {parent}, {child} IN ACCESS EXCLUSIVE MODE"))
+
+    # Partition keys must be NOT NULL, and line items need their own copy
+    # of the document date to be partitioned on it
+    conn.execute(text(f"UPDATE {parent} SET {date_col} = now() WHERE {date_col} IS NULL"))
+    conn.execute(text(f"ALTER TABLE {child} ADD COLUMN IF NOT EXISTS {date_col} TIMESTAMP"))
+    conn.execute(text(
+        f"UPDATE {child} c SET {date_col} = p.{date_col} FROM {parent} p "
+        f"WHERE p.id = c.{parent_key} AND c.{date_col} IS DISTINCT FROM p.{date_col}"
+    ))
+
+    first_date = conn.execute(text(f"SELECT min({date_col}) FROM {parent}")).scalar()
+    first = month_start(first_date or datetime.utcnow())
+    last = add_months(month_start(datetime.utcnow()), months_ahead)
+
+    parent_seq = conn.execute(text("SELECT pg_get_serial_sequence(:t, 'id')"), {'t': parent}).scalar()
+    child_seq = conn.execute(text("SELECT pg_get_serial_sequence(:t, 'id')"), {'t': child}).scalar()
+
+    conn.execute(text(f"ALTER TABLE {parent} RENAME TO {parent}_legacy"))
+    conn.execute(text(f"ALTER TABLE {child} RENAME TO {child}_legacy"))
+
+    # Unique constraints on a partitioned table must include the partition key,
+    # so numbers stay unique across months through the document_numbers table
+    conn.execute(text(
+        f"INSERT INTO document_numbers (doc_type, number) SELECT :doc_type, {number_col} "
+        f"FROM {parent}_legacy ON CONFLICT DO NOTHING"
+    ), {'doc_type': spec['doc_type']})
+    conn.execute(text(
+        f"CREATE TABLE {parent} (LIKE {parent}_legacy INCLUDING DEFAULTS) "
+        f"PARTITION BY RANGE ({date_col})"
+    ))
+    conn.execute(text(f"ALTER TABLE {parent} ADD PRIMARY KEY (id, {date_col})"))
+    conn.execute(text(f"ALTER TABLE {parent} ADD UNIQUE ({number_col}, {date_col})"))
+    conn.execute(text(f"CREATE INDEX ix_{parent}_{date_col} ON {parent} ({date_col})"))
+    # LIKE copies no foreign keys
+    for column, referenced in spec['references']:
+        conn.execute(text(f"ALTER TABLE {parent} ADD FOREIGN KEY ({column}) REFERENCES {referenced} (id)"))
+
+    conn.execute(text(
+        f"CREATE TABLE {child} (LIKE {child}_legacy INCLUDING DEFAULTS) "
+        f"PARTITION BY RANGE ({date_col})"
+    ))
+    conn.execute(text(f"ALTER TABLE {child} ALTER COLUMN {date_col} SET NOT NULL"))
+    conn.execute(text(f"ALTER TABLE {child} ADD PRIMARY KEY (id, {date_col})"))
+    conn.execute(text(
+        f"ALTER TABLE {child} ADD FOREIGN KEY ({parent_key}, {date_col}) "
+        f"REFERENCES {parent} (id, {date_col}) ON DELETE CASCADE"
+    ))
+    conn.execute(text(f"ALTER TABLE {child} ADD FOREIGN KEY (item_id) REFERENCES items (id)"))
+    conn.execute(text(f"CREATE INDEX ix_{child}_{parent_key} ON {child} ({parent_key})"))
+    conn.execute(text(f"CREATE INDEX ix_{child}_item_id ON {child} (item_id)"))
+
+    for table in (parent, child):
+        start = first
+        while start <= last:
+            create_month_partition(conn, table, start)
+            start = add_months(start, 1)
+        conn.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+
+    conn.execute(text(f"INSERT INTO {parent} SELECT * FROM {parent}_legacy"))
+    conn.execute(text(f"INSERT INTO {child} SELECT * FROM {child}_legacy"))
+
+    # Keep the id sequences alive when the legacy tables are dropped
+    if parent_seq:
+        conn.execute(text(f"ALTER SEQUENCE {parent_seq} OWNED BY {parent}.id"))
+    if child_seq:
+        conn.execute(text(f"ALTER SEQUENCE {child_seq} OWNED BY {child}.id"))
+
+    # CASCADE drops the ledger foreign keys; those tables keep their ids
+    conn.execute(text(f"DROP TABLE {child}_legacy"))
+    conn.execute(text(f"DROP TABLE {parent}_legacy CASCADE"))
+    conn.execute(text(f"ANALYZE {parent}"))
+    conn.execute(text(f"ANALYZE {child}"))
+
+
+def _register_number(connection, doc_type, number):
+    """Claim a document number; a duplicate fails the insert like a unique constraint"""
+    connection.execute(insert(DocumentNumber.__table__).values(doc_type=doc_type, number=number))
+
+
+def _copy_document_date(target, document, date_column):
+    """Stamp a line item with its document date, the partition key"""
+    if getattr(target, date_column) is None:
+        setattr(target, date_column, getattr(document, date_column))
+
+
+@event.listens_for(Sale, 'before_insert')
+def register_bill_number(mapper, connection, target):
+    if app.config.get('PARTITION_BY_MONTH'):
+        _register_number(connection, 'sale', target.bill_number)
+
+
+@event.listens_for(Purchase, 'before_insert')
+def register_invoice_number(mapper, connection, target):
+    if app.config.get('PARTITION_BY_MONTH'):
+        _register_number(connection, 'purchase', target.invoice_number)
+
+
+# Line items are created with their document attached (SaleItem(sale=...)),
+# so its date is read from memory rather than queried per line
+@event.listens_for(SaleItem, 'before_insert')
+def stamp_sale_item_date(mapper, connection, target):
+    if app.config.get('PARTITION_BY_MONTH'):
+        _copy_document_date(target, target.sale, 'sale_date')
+
+
+@event.listens_for(PurchaseItem, 'before_insert')
+def stamp_purchase_item_date(mapper, connection, target):
+    if app.config.get('PARTITION_BY_MONTH'):
+        _copy_document_date(target, target.purchase, 'purchase_date')
+
+
+@app.cli.group()
+def partitions():
+    """Manage monthly partitions of sales and purchases."""
+
+
+@partitions.command('migrate')
+@click.option('--months-ahead', type=int, default=None, help='Future months to pre-create.')
+def migrate_command(months_ahead):
+    """Convert existing sales and purchase tables to monthly partitions."""
+    if db.engine.dialect.name != 'postgresql':
+        raise click.ClickException('Partitioning requires PostgreSQL')
+    if months_ahead is None:
+        months_ahead = app.config.get('PARTITION_MONTHS_AHEAD', 3)
+
+    for spec in PARTITIONED_TABLES:
+        with db.engine.begin() as conn:
+            if is_partitioned(conn, spec['parent']):
+                click.echo(f"{spec['parent']} is already partitioned")
+                continue
+            migrate_table(conn, spec, months_ahead)
+            click.echo(f"Partitioned {spec['parent']} and {spec['child']} by month")
+
+
+@partitions.command('ensure')
+@click.option('--months-ahead', type=int, default=None, help='Future months to pre-create.')
+def ensure_command(months_ahead):
+    """Create upcoming monthly partitions (run daily from cron)."""
+    if db.engine.dialect.name != 'postgresql':
+        raise click.ClickException('Partitioning requires PostgreSQL')
+    created = ensure_partitions(months_ahead)
+    click.echo(f"Ensured {created} monthly partitions")
@@ -0,0 +1,170 @@
+import threading
+from bisect import bisect_right
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from app import app, db
+from models import PriceList, PriceRule
+from catalog import catalog
+
+TIERS = ('retail', 'wholesale')
+
+PRICE_PLACES = Decimal('0.01')
+HUNDRED = Decimal('100')
+
+
+class PriceBreaks:
+    """Quantity breaks of one rule scope, with the best fixed price and
+    discount reached at each break, so a lookup is a single bisect"""
+    __slots__ = ('quantities', 'prices', 'discounts')
+
+    def __init__(self, rules):
+        self.quantities = []
+        self.prices = []
+        self.discounts = []
+        best_price = None
+        best_discount = Decimal('0')
+        for min_quantity, price, discount_rate in sorted(rules, key=lambda rule: rule[0]):
+            if price is not None and (best_price is None or price < best_price):
+                best_price = price
+            if discount_rate is not None and discount_rate > best_discount:
+                best_discount = discount_rate
+            if self.quantities and self.quantities[-1] == min_quantity:
+                self.prices[-1] = best_price
+                self.discounts[-1] = best_discount
+            else:
+                self.quantities.append(min_quantity)
+                self.prices.append(best_price)
+                self.discounts.append(best_discount)
+
+    def lookup(self, quantity):
+        """(fixed price or None, discount rate) for quantity, or None below the first break"""
+        i = bisect_right(self.quantities, quantity) - 1
+        if i < 0:
+            return None
+        return self.prices[i], self.discounts[i]
+
+
+def tier_price(entry, tier):
+    """List price of a catalog entry for a tier, before price rules"""
+    return entry.wholesale if tier == 'wholesale' else entry.sp
+
+
+class PriceBook:
+    """Price rules of all active price lists, compiled per worker into
+    PriceBreaks keyed by (tier, scope, key) where scope is item, category
+    or all. Recompiled whenever the catalog version moves; price list
+    changes bump it like item edits do.
+    """
+
+    def __init__(self):
+        self._tables = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _compile(self):
+        rules = db.session.execute(
+            select(PriceList.tier, PriceRule.item_id, PriceRule.category, PriceRule.min_quantity,
+                   PriceRule.price, PriceRule.discount_rate)
+            .join(PriceRule, PriceRule.price_list_id == PriceList.id)
+            .where(PriceList.active.is_(True))
+        ).all()
+
+        grouped = {}
+        for rule in rules:
+            if rule.item_id is not None:
+                scope = ('item', rule.item_id)
+            elif rule.category:
+                scope = ('category', rule.category)
+            else:
+                scope = ('all', None)
+            for tier in ((rule.tier,) if rule.tier else TIERS):
+                grouped.setdefault((tier,) + scope, []).append(
+                    (rule.min_quantity, rule.price, rule.discount_rate))
+
+        return {key: PriceBreaks(group) for key, group in grouped.items()}
+
+    def tables(self):
+        version = catalog.version()
+        with self._lock:
+            if self._tables is not None and self._version == version:
+                return self._tables
+        tables = self._compile()
+        with self._lock:
+            self._tables = tables
+            self._version = version
+        return tables
+
+    def resolve(self, tables, entry, tier, quantity):
+        """Best unit price for quantity of a catalog entry"""
+        base = tier_price(entry, tier)
+        best = base
+        for scope in (('item', entry.id), ('category', entry.category), ('all', None)):
+            breaks = tables.get((tier,) + scope)
+            found = breaks.lookup(quantity) if breaks else None
+            if found is None:
+                continue
+            price, discount_rate = found
+            if price is not None and price < best:
+                best = price
+            if discount_rate:
+                discounted = base * (HUNDRED - discount_rate) / HUNDRED
+                if discounted < best:
+                    best = discounted
+        return best.quantize(PRICE_PLACES)
+
+    def price_lines(self, tier, lines):
+        """Unit prices for [(item_id, quantity), ...], None for unknown items.
+
+        One catalog lookup for the whole bill and no per-line queries.
+        """
+        tables = self.tables()
+        entries = catalog.get_many({item_id for item_id, _ in lines})
+        prices = []
+        for item_id, quantity in lines:
+            entry = entries.get(item_id)
+            prices.append(self.resolve(tables, entry, tier, Decimal(quantity)) if entry else None)
+        return prices
+
+
+price_book = PriceBook()
+
+
+def customer_tier(customer):
+    tier = customer.price_tier if customer is not None else None
+    return tier if tier in TIERS else app.config['DEFAULT_PRICE_TIER']
+
+
+def purchase_terms(vendor, subtotal, discount):
+    """Apply a vendor's trade discount, excise and VAT rates to a purchase.
+
+    Excise is charged on the discounted amount and VAT on the amount
+    including excise. Returns the purchase amount fields.
+    """
+    discount = Decimal(discount)
+    excise_amount = vat_amount = Decimal('0')
+    if vendor is not None:
+        discount += subtotal * Decimal(vendor.discount_rate or 0) / HUNDRED
+    taxable_amount = subtotal - discount
+    if vendor is not None:
+        excise_amount = taxable_amount * Decimal(vendor.excise_rate or 0) / HUNDRED
+        vat_amount = (taxable_amount + excise_amount) * Decimal(vendor.vat_rate or 0) / HUNDRED
+    return {
+        'subtotal_amount': subtotal.quantize(PRICE_PLACES),
+        'discount': discount.quantize(PRICE_PLACES),
+        'taxable_amount': taxable_amount.quantize(PRICE_PLACES),
+        'excise_amount': excise_amount.quantize(PRICE_PLACES),
+        'vat_amount': vat_amount.quantize(PRICE_PLACES),
+        'total_amount': (taxable_amount + excise_amount + vat_amount).quantize(PRICE_PLACES),
+        'excise_enabled': excise_amount > 0,
+        'vat_enabled': vat_amount > 0,
+    }
+
+
+def landed_cost_factor(purchase):
+    """Share of a purchase's list prices that ends up in inventory cost:
+    net of discounts, including excise, excluding (recoverable) VAT"""
+    if not purchase.subtotal_amount:
+        return Decimal('1')
+    return (Decimal(purchase.taxable_amount) + Decimal(purchase.excise_amount or 0)) / Decimal(purchase.subtotal_amount)
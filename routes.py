@@ -1,13 +1,27 @@
+import hmac
 import os
+from datetime import timedelta
 from decimal import Decimal
-from flask import render_template, request, redirect, url_for, flash, session, jsonify
+from flask import (render_template, request, redirect, url_for, flash, session, jsonify, abort,
+                   Response, stream_with_context)
 from werkzeug.utils import secure_filename
 from app import app, db
-from models import User, Customer, Vendor, Item, Sale, SaleItem, Purchase, PurchaseItem
+from models import (User, Customer, Vendor, Item, Sale, SaleItem, Purchase, PurchaseItem,
+                    PriceList, PriceRule, Stocktake, StocktakeLine)
 from forms import (LoginForm, CustomerForm, VendorForm, ItemForm, ExcelUploadForm, 
-                  SaleForm, PurchaseForm)
+                  SaleForm, PurchaseForm, ReportFilterForm, PriceListForm, PriceRuleForm,
+                  StocktakeUploadForm)
 from utils import process_excel_file, generate_invoice_number
-from sqlalchemy import func
+from archive import find_document
+from events import publish, publish_stock, event_stream, broker
+import costing
+from catalog import catalog, bump_catalog_version, in_stock_items
+from changefeed import record, read_changes, parse_cursor
+from pricing import price_book, customer_tier, purchase_terms, landed_cost_factor
+from stocktake import read_count_sheet, stage_counts, variance_report, apply_stocktake
+from partitioning import partitioning_available
+from sqlalchemy import func, select, case, and_
+from sqlalchemy.orm import joinedload
 
 # Authentication decorator
 def login_required(f):
@@ -94,9 +108,11 @@ def add_customer():
             email=form.email.data,
             phone=form.phone.data,
             address=form.address.data,
-            balance=form.balance.data or 0.00
+            balance=form.balance.data or 0.00,
+            price_tier=form.price_tier.data
         )
         db.session.add(customer)
+        record(customer)
         db.session.commit()
         flash('Customer added successfully!', 'success')
         return redirect(url_for('customers'))
@@ -115,6 +131,8 @@ def edit_customer(id):
         customer.phone = form.phone.data
         customer.address = form.address.data
         customer.balance = form.balance.data or 0.00
+        customer.price_tier = form.price_tier.data
+        record(customer)
         db.session.commit()
         flash('Customer updated successfully!', 'success')
         return redirect(url_for('customers'))
@@ -125,6 +143,7 @@ def edit_customer(id):
 @login_required
 def delete_customer(id):
     customer = Customer.query.get_or_404(id)
+    record(customer, 'delete')
     db.session.delete(customer)
     db.session.commit()
     flash('Customer deleted successfully!', 'success')
@@ -154,6 +173,7 @@ def add_vendor():
             excise_rate=form.excise_rate.data or 0.00
         )
         db.session.add(vendor)
+        record(vendor)
         db.session.commit()
         flash('Vendor added successfully!', 'success')
         return redirect(url_for('vendors'))
@@ -176,6 +196,7 @@ def edit_vendor(id):
         vendor.discount_rate = form.discount_rate.data or 0.00
         vendor.vat_rate = form.vat_rate.data or 0.00
         vendor.excise_rate = form.excise_rate.data or 0.00
+        record(vendor)
         db.session.commit()
         flash('Vendor updated successfully!', 'success')
         return redirect(url_for('vendors'))
@@ -186,6 +207,7 @@ def edit_vendor(id):
 @login_required
 def delete_vendor(id):
     vendor = Vendor.query.get_or_404(id)
+    record(vendor, 'delete')
     db.session.delete(vendor)
     db.session.commit()
     flash('Vendor deleted successfully!', 'success')
@@ -216,6 +238,7 @@ def add_item():
             current_quantity=form.opening_quantity.data or 0.00
         )
         db.session.add(item)
+        record(item)
         db.session.commit()
         flash('Item added successfully!', 'success')
         return redirect(url_for('items'))
@@ -238,6 +261,8 @@ def edit_item(id):
         item.sp = form.sp.data
         item.uom = form.uom.data
         item.opening_quantity = form.opening_quantity.data or 0.00
+        record(item)
+        bump_catalog_version()
         db.session.commit()
         flash('Item updated successfully!', 'success')
         return redirect(url_for('items'))
@@ -248,7 +273,9 @@ def edit_item(id):
 @login_required
 def delete_item(id):
     item = Item.query.get_or_404(id)
+    record(item, 'delete')
     db.session.delete(item)
+    bump_catalog_version()
     db.session.commit()
     flash('Item deleted successfully!', 'success')
     return redirect(url_for('items'))
@@ -280,18 +307,87 @@ def import_items():
     
     return render_template('item_form.html', form=form, title='Import Items from Excel', is_import=True)
 
+# Stocktake routes
+@app.route('/stocktakes', methods=['GET', 'POST'])
+@login_required
+def stocktakes():
+    form = StocktakeUploadForm()
+    if form.validate_on_submit():
+        try:
+            counts, skipped = read_count_sheet(form.file.data)
+            stocktake = stage_counts(form.name.data, counts)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error reading count sheet: {str(e)}', 'error')
+        else:
+            message = f'Loaded {len(counts)} counted items'
+            if skipped:
+                message += f'; skipped {skipped} rows without a serial number or valid count'
+            flash(message, 'success')
+            return redirect(url_for('view_stocktake', id=stocktake.id))
+    
+    stocktakes = Stocktake.query.order_by(Stocktake.created_at.desc()).all()
+    return render_template('stocktakes.html', form=form, stocktakes=stocktakes)
+
+@app.route('/stocktakes/<int:id>')
+@login_required
+def view_stocktake(id):
+    stocktake = Stocktake.query.get_or_404(id)
+    return render_template('stocktake.html', stocktake=stocktake, report=variance_report(stocktake))
+
+@app.route('/stocktakes/<int:id>/lines/<int:line_id>/toggle')
+@login_required
+def toggle_stocktake_line(id, line_id):
+    stocktake = Stocktake.query.get_or_404(id)
+    line = StocktakeLine.query.filter_by(id=line_id, stocktake_id=id).first_or_404()
+    if stocktake.status != 'draft':
+        abort(400)
+    line.skip = not line.skip
+    db.session.commit()
+    return redirect(url_for('view_stocktake', id=id))
+
+@app.route('/stocktakes/<int:id>/apply', methods=['POST'])
+@login_required
+def apply_stocktake_counts(id):
+    # Lock the stocktake so it can only be applied once
+    stocktake = Stocktake.query.filter_by(id=id).with_for_update().first_or_404()
+    if stocktake.status != 'draft':
+        flash('This stocktake has already been applied', 'error')
+        return redirect(url_for('view_stocktake', id=id))
+    
+    try:
+        adjusted = apply_stocktake(stocktake)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error applying stocktake: {str(e)}', 'error')
+    else:
+        flash(f'Stocktake applied; adjusted stock of {adjusted} items', 'success')
+    return redirect(url_for('view_stocktake', id=id))
+
+@app.route('/stocktakes/<int:id>/delete')
+@login_required
+def delete_stocktake(id):
+    stocktake = Stocktake.query.get_or_404(id)
+    # Staged lines can run to many thousands; drop them in one statement
+    StocktakeLine.query.filter_by(stocktake_id=id).delete(synchronize_session=False)
+    db.session.delete(stocktake)
+    db.session.commit()
+    flash('Stocktake deleted successfully!', 'success')
+    return redirect(url_for('stocktakes'))
+
 # Sales routes
 @app.route('/sales')
 @login_required
 def sales():
-    sales = Sale.query.order_by(Sale.sale_date.desc()).all()
+    sales = Sale.query.options(joinedload(Sale.customer)).order_by(Sale.sale_date.desc()).all()
     return render_template('sales.html', sales=sales)
 
 @app.route('/sales/add', methods=['GET', 'POST'])
 @login_required
 def add_sale():
     customers = Customer.query.all()
-    items = Item.query.filter(Item.current_quantity > 0).all()
     
     if request.method == 'POST':
         try:
@@ -303,26 +399,37 @@ def add_sale():
             item_ids = request.form.getlist('item_id[]')
             quantities = request.form.getlist('quantity[]')
             unit_prices = request.form.getlist('unit_price[]')
+            # Prices the form filled in itself are only a preview and are repriced
+            # here; without the flags every entered price is taken as typed
+            manual_flags = request.form.getlist('price_manual[]') or ['1'] * len(item_ids)
             
             if not item_ids:
                 flash('Please add at least one item to the sale', 'error')
-                return render_template('sales_form.html', customers=customers, items=items, title='Add Sale')
+                return render_template('sales_form.html', customers=customers, items=in_stock_items(), title='Add Sale')
+            
+            # Load and lock every item on the bill in one query
+            sale_items = costing.lock_items(int(i) for i in item_ids if i)
+            
+            # Lines without a typed price get the customer's tier price
+            lines = [(int(item_ids[i]), Decimal(quantities[i]), unit_prices[i] if manual_flags[i] else '')
+                     for i in range(len(item_ids)) if item_ids[i] and quantities[i]]
+            customer = Customer.query.get(int(customer_id)) if customer_id else None
+            tier_prices = price_book.price_lines(customer_tier(customer),
+                                                 [(item_id, quantity) for item_id, quantity, _ in lines])
             
             # Calculate totals
             total_amount = Decimal('0')
             sale_items_data = []
             
-            for i in range(len(item_ids)):
-                if item_ids[i] and quantities[i] and unit_prices[i]:
-                    item_id = int(item_ids[i])
-                    quantity = Decimal(quantities[i])
-                    unit_price = Decimal(unit_prices[i])
+            for (item_id, quantity, entered_price), tier_price in zip(lines, tier_prices):
+                if entered_price or tier_price is not None:
+                    unit_price = Decimal(entered_price) if entered_price else tier_price
                     
                     # Check stock availability
-                    item = Item.query.get(item_id)
+                    item = sale_items[item_id]
                     if item.current_quantity < quantity:
                         flash(f'Insufficient stock for {item.product}. Available: {item.current_quantity}', 'error')
-                        return render_template('sales_form.html', customers=customers, items=items, title='Add Sale')
+                        return render_template('sales_form.html', customers=customers, items=in_stock_items(), title='Add Sale')
                     
                     total_price = quantity * unit_price
                     total_amount += total_price
@@ -339,11 +446,12 @@ def add_sale():
             
             # Create sale
             sale = Sale(
-                invoice_number=generate_invoice_number("SALE"),
+                bill_number=generate_invoice_number("SALE"),
                 customer_id=int(customer_id) if customer_id else None,
-                total_amount=total_amount,
+                subtotal_amount=total_amount,
                 discount=discount,
-                final_amount=final_amount
+                taxable_amount=final_amount,
+                total_amount=final_amount
             )
             
             if notes:
@@ -354,19 +462,29 @@ def add_sale():
             
             # Add sale items and update inventory
             for item_data in sale_items_data:
+                item = sale_items[item_data['item_id']]
+                
+                # Stamp cost of goods sold before stock goes down
+                unit_cost = costing.issue(item, item_data['quantity'])
+                
                 sale_item = SaleItem(
-                    sale_id=sale.id,
+                    sale=sale,
                     item_id=item_data['item_id'],
                     quantity=item_data['quantity'],
                     unit_price=item_data['unit_price'],
-                    total_price=item_data['total_price']
+                    total_price=item_data['total_price'],
+                    unit_cost=unit_cost,
+                    cost_amount=costing.line_cost(item_data['quantity'], unit_cost)
                 )
                 db.session.add(sale_item)
                 
                 # Update item quantity
-                item = Item.query.get(item_data['item_id'])
                 item.current_quantity -= item_data['quantity']
+                publish_stock(item)
+                record(item)
             
+            record(sale)
+            publish('sale', id=sale.id, bill_number=sale.bill_number, total_amount=float(sale.total_amount))
             db.session.commit()
             flash('Sale created successfully!', 'success')
             return redirect(url_for('sales'))
@@ -375,13 +493,32 @@ def add_sale():
             db.session.rollback()
             flash(f'Error creating sale: {str(e)}', 'error')
     
-    return render_template('sales_form.html', customers=customers, items=items, title='Add Sale')
+    return render_template('sales_form.html', customers=customers, items=in_stock_items(), title='Add Sale')
+
+def invoice_catalog(document):
+    # Archived documents carry their own item snapshot
+    if getattr(document, 'archived', False):
+        return {}
+    return catalog.get_many({line.item_id for line in document.items})
 
 @app.route('/sales/view/<int:id>')
 @login_required
 def view_sale(id):
-    sale = Sale.query.get_or_404(id)
-    return render_template('invoice.html', sale=sale, title='Sale Invoice')
+    # Fall back to cold storage for sales of closed periods
+    sale = Sale.query.get(id) or find_document('sale', original_id=id)
+    if sale is None:
+        abort(404)
+    return render_template('invoice.html', sale=sale, catalog_items=invoice_catalog(sale),
+                           catalog_version=catalog.version(), title='Sale Invoice')
+
+@app.route('/sales/number/<path:number>')
+@login_required
+def view_sale_by_number(number):
+    sale = Sale.query.filter_by(bill_number=number).first() or find_document('sale', number=number)
+    if sale is None:
+        abort(404)
+    return render_template('invoice.html', sale=sale, catalog_items=invoice_catalog(sale),
+                           catalog_version=catalog.version(), title='Sale Invoice')
 
 @app.route('/sales/delete/<int:id>')
 @login_required
@@ -389,10 +526,16 @@ def delete_sale(id):
     sale = Sale.query.get_or_404(id)
     
     # Restore inventory quantities
+    items = costing.lock_items(sale_item.item_id for sale_item in sale.items)
     for sale_item in sale.items:
-        item = Item.query.get(sale_item.item_id)
+        item = items[sale_item.item_id]
+        costing.reverse_issue(item, sale_item.quantity, sale_item.unit_cost)
         item.current_quantity += sale_item.quantity
+        publish_stock(item)
+        record(item)
     
+    record(sale, 'delete')
+    publish('sale_deleted', id=sale.id, bill_number=sale.bill_number)
     db.session.delete(sale)
     db.session.commit()
     flash('Sale deleted successfully!', 'success')
@@ -445,16 +588,14 @@ def add_purchase():
                         'total_price': total_price
                     })
             
-            # Calculate final amount
-            final_amount = total_amount - discount
+            # Apply the vendor's discount and tax terms
+            vendor = Vendor.query.get(int(vendor_id)) if vendor_id else None
             
             # Create purchase
             purchase = Purchase(
                 invoice_number=generate_invoice_number("PUR"),
-                vendor_id=int(vendor_id) if vendor_id else None,
-                total_amount=total_amount,
-                discount=discount,
-                final_amount=final_amount
+                vendor_id=vendor.id if vendor else None,
+                **purchase_terms(vendor, total_amount, discount)
             )
             
             if notes:
@@ -462,11 +603,13 @@ def add_purchase():
             
             db.session.add(purchase)
             db.session.flush()  # Get the purchase ID
+            cost_factor = landed_cost_factor(purchase)
+            purchase_items = costing.lock_items(item_data['item_id'] for item_data in purchase_items_data)
             
             # Add purchase items and update inventory
             for item_data in purchase_items_data:
                 purchase_item = PurchaseItem(
-                    purchase_id=purchase.id,
+                    purchase=purchase,
                     item_id=item_data['item_id'],
                     quantity=item_data['quantity'],
                     unit_price=item_data['unit_price'],
@@ -474,10 +617,16 @@ def add_purchase():
                 )
                 db.session.add(purchase_item)
                 
-                # Update item quantity
-                item = Item.query.get(item_data['item_id'])
+                # Update running cost, then item quantity
+                item = purchase_items[item_data['item_id']]
+                costing.receive(item, item_data['quantity'], item_data['unit_price'] * cost_factor, purchase.id)
                 item.current_quantity += item_data['quantity']
+                publish_stock(item)
+                record(item)
             
+            record(purchase)
+            publish('purchase', id=purchase.id, invoice_number=purchase.invoice_number,
+                    total_amount=float(purchase.total_amount))
             db.session.commit()
             flash('Purchase created successfully!', 'success')
             return redirect(url_for('purchases'))
@@ -491,8 +640,24 @@ def add_purchase():
 @app.route('/purchases/view/<int:id>')
 @login_required
 def view_purchase(id):
-    purchase = Purchase.query.get_or_404(id)
-    return render_template('invoice.html', purchase=purchase, title='Purchase Invoice')
+    # Fall back to cold storage for purchases of closed periods
+    purchase = Purchase.query.get(id) or find_document('purchase', original_id=id)
+    if purchase is None:
+        abort(404)
+    return render_template('invoice.html', purchase=purchase, catalog_items=invoice_catalog(purchase),
+                           catalog_version=catalog.version(),
+                           title='Purchase Invoice')
+
+@app.route('/purchases/number/<path:number>')
+@login_required
+def view_purchase_by_number(number):
+    purchase = (Purchase.query.filter_by(invoice_number=number).first()
+                or find_document('purchase', number=number))
+    if purchase is None:
+        abort(404)
+    return render_template('invoice.html', purchase=purchase, catalog_items=invoice_catalog(purchase),
+                           catalog_version=catalog.version(),
+                           title='Purchase Invoice')
 
 @app.route('/purchases/delete/<int:id>')
 @login_required
@@ -500,24 +665,273 @@ def delete_purchase(id):
     purchase = Purchase.query.get_or_404(id)
     
     # Restore inventory quantities
+    cost_factor = landed_cost_factor(purchase)
+    items = costing.lock_items(purchase_item.item_id for purchase_item in purchase.items)
     for purchase_item in purchase.items:
-        item = Item.query.get(purchase_item.item_id)
+        item = items[purchase_item.item_id]
+        costing.reverse_receipt(item, purchase_item.quantity, purchase_item.unit_price * cost_factor, purchase.id)
         item.current_quantity -= purchase_item.quantity
+        publish_stock(item)
+        record(item)
     
+    record(purchase, 'delete')
+    publish('purchase_deleted', id=purchase.id, invoice_number=purchase.invoice_number)
     db.session.delete(purchase)
     db.session.commit()
     flash('Purchase deleted successfully!', 'success')
     return redirect(url_for('purchases'))
 
+# Pricing routes
+@app.route('/pricing')
+@login_required
+def pricing():
+    price_lists = (PriceList.query
+                   .options(joinedload(PriceList.rules).joinedload(PriceRule.item))
+                   .order_by(PriceList.name).all())
+    list_form = PriceListForm()
+    rule_form = pricing_rule_form()
+    return render_template('pricing.html', price_lists=price_lists, list_form=list_form, rule_form=rule_form)
+
+def pricing_rule_form():
+    form = PriceRuleForm()
+    form.price_list_id.choices = [(p.id, p.name) for p in PriceList.query.order_by(PriceList.name)]
+    items = db.session.execute(select(Item.id, Item.sn, Item.product).order_by(Item.sn))
+    form.item_id.choices = [(0, 'Any item')] + [(i.id, f'{i.sn} - {i.product}') for i in items]
+    return form
+
+@app.route('/pricing/lists/add', methods=['POST'])
+@login_required
+def add_price_list():
+    form = PriceListForm()
+    if form.validate_on_submit():
+        price_list = PriceList(name=form.name.data, tier=form.tier.data or None, active=form.active.data)
+        db.session.add(price_list)
+        bump_catalog_version()
+        db.session.commit()
+        flash('Price list added successfully!', 'success')
+    else:
+        flash('Please enter a name for the price list', 'error')
+    return redirect(url_for('pricing'))
+
+@app.route('/pricing/lists/toggle/<int:id>')
+@login_required
+def toggle_price_list(id):
+    price_list = PriceList.query.get_or_404(id)
+    price_list.active = not price_list.active
+    bump_catalog_version()
+    db.session.commit()
+    flash(f'Price list {"activated" if price_list.active else "deactivated"}', 'success')
+    return redirect(url_for('pricing'))
+
+@app.route('/pricing/lists/delete/<int:id>')
+@login_required
+def delete_price_list(id):
+    price_list = PriceList.query.get_or_404(id)
+    db.session.delete(price_list)
+    bump_catalog_version()
+    db.session.commit()
+    flash('Price list deleted successfully!', 'success')
+    return redirect(url_for('pricing'))
+
+@app.route('/pricing/rules/add', methods=['POST'])
+@login_required
+def add_price_rule():
+    form = pricing_rule_form()
+    if form.validate_on_submit():
+        rule = PriceRule(
+            price_list_id=form.price_list_id.data,
+            item_id=form.item_id.data or None,
+            category=(form.category.data or None) if not form.item_id.data else None,
+            min_quantity=form.min_quantity.data,
+            price=form.price.data,
+            discount_rate=form.discount_rate.data
+        )
+        db.session.add(rule)
+        bump_catalog_version()
+        db.session.commit()
+        flash('Price rule added successfully!', 'success')
+    else:
+        for errors in form.errors.values():
+            for error in errors:
+                flash(error, 'error')
+    return redirect(url_for('pricing'))
+
+@app.route('/pricing/rules/delete/<int:id>')
+@login_required
+def delete_price_rule(id):
+    rule = PriceRule.query.get_or_404(id)
+    db.session.delete(rule)
+    bump_catalog_version()
+    db.session.commit()
+    flash('Price rule deleted successfully!', 'success')
+    return redirect(url_for('pricing'))
+
+# Report routes
+MARGIN_GROUPS = {
+    'item': 'Item',
+    'category': 'Category',
+    'month': 'Month',
+}
+
+def month_bucket(column):
+    if db.engine.dialect.name == 'postgresql':
+        return func.to_char(column, 'YYYY-MM')
+    return func.strftime('%Y-%m', column)
+
+@app.route('/reports/margin')
+@login_required
+def margin_report():
+    form = ReportFilterForm(request.args, meta={'csrf': False})
+    group = request.args.get('group', 'item')
+    if group not in MARGIN_GROUPS:
+        group = 'item'
+    
+    rows = []
+    totals = None
+    if request.args and form.validate():
+        if group == 'item':
+            keys = [Item.sn, Item.product]
+        elif group == 'category':
+            keys = [func.coalesce(Item.category, '')]
+        else:
+            keys = [month_bucket(Sale.sale_date)]
+        
+        # Margins are plain aggregates over the COGS stamped on each line
+        revenue = func.sum(SaleItem.total_price)
+        cogs = func.sum(SaleItem.cost_amount)
+        uncosted = func.sum(case((SaleItem.cost_amount.is_(None), 1), else_=0))
+        start = form.start_date.data
+        end = form.end_date.data + timedelta(days=1)
+        on = [SaleItem.sale_id == Sale.id]
+        period = [Sale.sale_date >= start, Sale.sale_date < end]
+        if partitioning_available():
+            # Bound the line items on their own partition key as well, so
+            # PostgreSQL prunes sale_items partitions along with sales
+            on.append(SaleItem.sale_date == Sale.sale_date)
+            period += [SaleItem.sale_date >= start, SaleItem.sale_date < end]
+        query = (db.session.query(*[k.label(f'key{i}') for i, k in enumerate(keys)],
+                                  func.sum(SaleItem.quantity).label('quantity'),
+                                  revenue.label('revenue'),
+                                  cogs.label('cogs'),
+                                  uncosted.label('uncosted'))
+                 .join(Sale, and_(*on))
+                 .join(Item, SaleItem.item_id == Item.id)
+                 .filter(*period)
+                 .group_by(*keys)
+                 .order_by(revenue.desc()))
+        
+        for row in query:
+            revenue_amount = row.revenue or Decimal('0')
+            cost_amount = row.cogs or Decimal('0')
+            margin = revenue_amount - cost_amount
+            rows.append({
+                'label': ' - '.join(str(getattr(row, f'key{i}') or '-') for i in range(len(keys))),
+                'quantity': row.quantity,
+                'revenue': revenue_amount,
+                'cogs': cost_amount,
+                'margin': margin,
+                'margin_pct': (margin / revenue_amount * 100) if revenue_amount else None,
+                'uncosted': row.uncosted,
+            })
+        
+        total_revenue = sum((r['revenue'] for r in rows), Decimal('0'))
+        total_cogs = sum((r['cogs'] for r in rows), Decimal('0'))
+        totals = {
+            'revenue': total_revenue,
+            'cogs': total_cogs,
+            'margin': total_revenue - total_cogs,
+            'margin_pct': ((total_revenue - total_cogs) / total_revenue * 100) if total_revenue else None,
+        }
+    
+    return render_template('margin_report.html', form=form, group=group, groups=MARGIN_GROUPS,
+                           rows=rows, totals=totals)
+
 # API routes for dynamic data
 @app.route('/api/item/<int:id>')
 @login_required
 def get_item(id):
-    item = Item.query.get_or_404(id)
-    return jsonify({
+    item = catalog.get(id)
+    if item is None:
+        abort(404)
+    return jsonify(item_json(item))
+
+@app.route('/api/item/sn/<path:sn>')
+@login_required
+def get_item_by_sn(sn):
+    item = catalog.get_by_sn(sn)
+    if item is None:
+        abort(404)
+    return jsonify(item_json(item))
+
+def item_json(item):
+    # Prices come from the catalog cache; stock is always read fresh
+    current_quantity = db.session.execute(
+        select(Item.current_quantity).where(Item.id == item.id)
+    ).scalar()
+    return {
         'id': item.id,
+        'sn': item.sn,
         'product': item.product,
         'sp': float(item.sp),
-        'current_quantity': float(item.current_quantity),
+        'current_quantity': float(current_quantity or 0),
         'uom': item.uom
+    }
+
+@app.route('/api/prices', methods=['POST'])
+@login_required
+def api_prices():
+    # Price every line of a bill in one request
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'expected a JSON object'}), 400
+    try:
+        lines = [(int(line['item_id']), Decimal(str(line.get('quantity') or 1))) for line in data.get('lines', [])]
+        customer_id = int(data['customer_id']) if data.get('customer_id') else None
+    except (KeyError, TypeError, ValueError, AttributeError, ArithmeticError):
+        return jsonify({'error': 'lines must be a list of {item_id, quantity} and customer_id an integer'}), 400
+    
+    customer = Customer.query.get(customer_id) if customer_id else None
+    tier = customer_tier(customer)
+    prices = price_book.price_lines(tier, lines)
+    return jsonify({
+        'tier': tier,
+        'lines': [{'item_id': item_id, 'quantity': str(quantity),
+                   'unit_price': str(price) if price is not None else None}
+                  for (item_id, quantity), price in zip(lines, prices)],
     })
+
+def changes_token_valid():
+    token = app.config['CHANGES_API_TOKEN']
+    header = request.headers.get('Authorization', '')
+    return bool(token) and header.startswith('Bearer ') and hmac.compare_digest(header[7:], token)
+
+@app.route('/api/changes')
+def api_changes():
+    # Sync jobs authenticate with the bearer token; signed-in users may browse too
+    if not changes_token_valid() and 'user_id' not in session:
+        return jsonify({'error': 'unauthorized'}), 401
+    
+    try:
+        since = parse_cursor(request.args.get('since', '0'))
+    except ValueError:
+        return jsonify({'error': 'invalid cursor'}), 400
+    limit = request.args.get('limit', app.config['CHANGES_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['CHANGES_MAX_PAGE_SIZE']))
+    
+    changes, next_cursor, more = read_changes(since, limit)
+    return jsonify({'changes': changes, 'next': next_cursor, 'more': more})
+
+@app.route('/api/events')
+@login_required
+def api_events():
+    last_event_id = request.headers.get('Last-Event-ID', type=parse_cursor)
+    # Each open stream holds a worker thread; leave the rest for page requests
+    subscriber = broker.subscribe()
+    if subscriber is None:
+        # main.js tries again after a minute
+        return Response(status=503, headers={'Retry-After': '60'})
+    response = Response(stream_with_context(event_stream(subscriber, last_event_id)),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
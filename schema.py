@@ -0,0 +1,103 @@
+import logging
+
+import click
+from sqlalchemy import inspect, text
+
+from app import app, db
+from models import Item, Customer, SaleItem, PurchaseItem, ChangeLog, AppEvent
+
+# Columns added to tables that already existed in deployed databases.
+# db.create_all() only creates missing tables, so these are added in place.
+ADDED_COLUMNS = [
+    SaleItem.__table__.c.sale_date,
+    PurchaseItem.__table__.c.purchase_date,
+    Item.__table__.c.updated_at,
+    Customer.__table__.c.updated_at,
+    Item.__table__.c.avg_cost,
+    SaleItem.__table__.c.unit_cost,
+    SaleItem.__table__.c.cost_amount,
+    Customer.__table__.c.price_tier,
+    ChangeLog.__table__.c.txid,
+    AppEvent.__table__.c.txid,
+]
+
+
+
+def _index(model, name):
+    return next(index for index in model.__table__.indexes if index.name == name)
+
+
+# Indexes on those tables that came with later changes
+ADDED_INDEXES = [
+    _index(ChangeLog, 'ix_change_log_cursor'),
+    _index(AppEvent, 'ix_app_events_cursor'),
+]
+
+# Serializes schema changes between gunicorn workers starting up together
+SCHEMA_LOCK_ID = 726002
+
+
+def missing_columns(conn):
+    """ADDED_COLUMNS not yet present in the database"""
+    inspector = inspect(conn)
+    existing = {}
+    missing = []
+    for column in ADDED_COLUMNS:
+        table = column.table.name
+        if table not in existing:
+            existing[table] = {col['name'] for col in inspector.get_columns(table)}
+        if column.name not in existing[table]:
+            missing.append(column)
+    return missing
+
+
+def add_column(conn, column):
+    """Add one column to its table, filling in its default on existing rows"""
+    table = column.table.name
+    column_type = column.type.compile(dialect=conn.dialect)
+    # SQLite has no IF NOT EXISTS here; it is only reached after the inspector check
+    if_not_exists = 'IF NOT EXISTS ' if conn.dialect.name == 'postgresql' else ''
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {if_not_exists}{column.name} {column_type}"))
+
+    default = column.default
+    if default is not None and default.is_scalar:
+        conn.execute(text(f"UPDATE {table} SET {column.name} = :value WHERE {column.name} IS NULL"),
+                     {'value': default.arg})
+
+
+def upgrade_schema():
+    """Add any missing ADDED_COLUMNS and ADDED_INDEXES; safe to run repeatedly.
+    Returns their names."""
+    with db.engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {'id': SCHEMA_LOCK_ID})
+        added = []
+        for column in missing_columns(conn):
+            add_column(conn, column)
+            added.append(f"{column.table.name}.{column.name}")
+            logging.info(f"Added column {added[-1]}")
+        existing = {}
+        for index in ADDED_INDEXES:
+            table = index.table.name
+            if table not in existing:
+                existing[table] = {ix['name'] for ix in inspect(conn).get_indexes(table)}
+            if index.name not in existing[table]:
+                index.create(conn)
+                added.append(index.name)
+                logging.info(f"Added index {index.name}")
+    return added
+
+
+@app.cli.group()
+def schema():
+    """Manage the database schema."""
+
+
+@schema.command('upgrade')
+def upgrade_command():
+    """Add columns introduced since the tables were created."""
+    added = upgrade_schema()
+    if added:
+        click.echo(f"Added {', '.join(added)}")
+    else:
+        click.echo("Schema is up to date")
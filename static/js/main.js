@@ -10,6 +10,7 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeFormValidation();
     initializeTableEnhancements();
     initializeLoadingStates();
+    initializeLiveUpdates();
 });
 
 /**
@@ -367,6 +368,94 @@ function hideButtonLoading(button) {
     }
 }
 
+/**
+ * Live Updates via Server-Sent Events
+ */
+function initializeLiveUpdates() {
+    const eventsUrl = document.body.dataset.eventsUrl;
+    if (!eventsUrl || typeof EventSource === 'undefined') {
+        return;
+    }
+
+    // The browser reconnects on its own and resumes from Last-Event-ID
+    const source = new EventSource(eventsUrl);
+
+    source.addEventListener('stock', function(e) {
+        updateStockLevel(JSON.parse(e.data));
+    });
+
+    source.addEventListener('low_stock', function(e) {
+        const data = JSON.parse(e.data);
+        showToast(`Low stock: ${data.product} (${data.current_quantity} ${data.uom})`, 'warning');
+    });
+
+    source.addEventListener('sale', function(e) {
+        const data = JSON.parse(e.data);
+        adjustStat('total_sales', 1);
+        showToast(`New sale ${data.bill_number}`, 'success');
+    });
+
+    source.addEventListener('sale_deleted', function() {
+        adjustStat('total_sales', -1);
+    });
+
+    source.addEventListener('purchase', function(e) {
+        const data = JSON.parse(e.data);
+        adjustStat('total_purchases', 1);
+        showToast(`New purchase ${data.invoice_number}`, 'info');
+    });
+
+    source.addEventListener('purchase_deleted', function() {
+        adjustStat('total_purchases', -1);
+    });
+
+    // A busy server turns the stream away (503); the browser won't retry that on its own
+    source.addEventListener('error', function() {
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(initializeLiveUpdates, 60000);
+        }
+    });
+
+    window.addEventListener('beforeunload', function() {
+        source.close();
+    });
+}
+
+/**
+ * Query the document and the content of <template> elements
+ */
+function queryAllWithTemplates(selector) {
+    const matches = Array.from(document.querySelectorAll(selector));
+    document.querySelectorAll('template').forEach(function(template) {
+        matches.push(...template.content.querySelectorAll(selector));
+    });
+    return matches;
+}
+
+/**
+ * Patch every place an item's stock level is shown
+ */
+function updateStockLevel(data) {
+    document.querySelectorAll(`[data-stock-item="${data.item_id}"]`).forEach(function(el) {
+        el.textContent = data.current_quantity;
+    });
+
+    // Item pickers on the sale form, including rows not added yet
+    queryAllWithTemplates(`option[value="${data.item_id}"][data-stock]`).forEach(function(option) {
+        option.dataset.stock = data.current_quantity;
+        option.textContent = `${option.dataset.product || data.product} (Stock: ${data.current_quantity})`;
+    });
+}
+
+/**
+ * Adjust a dashboard counter
+ */
+function adjustStat(name, delta) {
+    document.querySelectorAll(`[data-stat="${name}"]`).forEach(function(el) {
+        el.textContent = (parseInt(el.textContent, 10) || 0) + delta;
+    });
+}
+
 /**
  * Confirm Delete Actions
  */
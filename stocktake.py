@@ -0,0 +1,169 @@
+import os
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import pandas as pd
+from sqlalchemy import select, update, insert, func, case, and_
+
+from app import app, db
+from models import Item, Stocktake, StocktakeLine
+from events import publish, publish_many
+from changefeed import record_many
+import costing
+
+# Upload columns
+SN_COLUMN = 'sn'
+COUNT_COLUMN = 'counted_qty'
+
+
+def read_count_sheet(file):
+    """Read (sn, counted quantity) pairs from an uploaded CSV or Excel file.
+
+    Counts for the same serial number on several sheets or rows are added
+    up. Returns (counts, skipped row count) or raises ValueError.
+    """
+    ext = os.path.splitext(file.filename or '')[1].lower()
+    if ext == '.csv':
+        df = pd.read_csv(file.stream, dtype={SN_COLUMN: str})
+    else:
+        sheets = pd.read_excel(file.stream, sheet_name=None, dtype={SN_COLUMN: str})
+        df = pd.concat(sheets.values(), ignore_index=True)
+
+    missing = [col for col in (SN_COLUMN, COUNT_COLUMN) if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    df = df[[SN_COLUMN, COUNT_COLUMN]].copy()
+    df[SN_COLUMN] = df[SN_COLUMN].str.strip()
+    df[COUNT_COLUMN] = pd.to_numeric(df[COUNT_COLUMN], errors='coerce')
+    valid = df[SN_COLUMN].notna() & (df[SN_COLUMN] != '') & df[COUNT_COLUMN].notna() & (df[COUNT_COLUMN] >= 0)
+    counts = df[valid].groupby(SN_COLUMN, sort=False)[COUNT_COLUMN].sum()
+    return counts, int((~valid).sum())
+
+
+def stage_counts(name, counts):
+    """Create a draft stocktake and bulk load its counts into the staging table"""
+    stocktake = Stocktake(name=name)
+    db.session.add(stocktake)
+    db.session.flush()
+
+    rows = []
+    for sn, counted in counts.items():
+        try:
+            counted = Decimal(str(counted)).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            continue
+        rows.append({'stocktake_id': stocktake.id, 'sn': sn, 'counted_quantity': counted, 'skip': False})
+
+    chunk_size = app.config['STOCKTAKE_CHUNK_SIZE']
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(insert(StocktakeLine), rows[start:start + chunk_size])
+
+    # Match serial numbers to items in one statement
+    db.session.execute(
+        update(StocktakeLine)
+        .where(StocktakeLine.stocktake_id == stocktake.id)
+        .values(item_id=select(Item.id).where(Item.sn == StocktakeLine.sn).scalar_subquery())
+    )
+    return stocktake
+
+
+def variance_query(stocktake_id, applied=False):
+    """Counted lines joined to their items, with variance and its value at cost price.
+
+    Variances are against current stock, or for an applied stocktake
+    against the stock on hand when it was applied.
+    """
+    system_quantity = StocktakeLine.system_quantity if applied else Item.current_quantity
+    variance = (StocktakeLine.counted_quantity - system_quantity).label('variance')
+    return (select(StocktakeLine.id, StocktakeLine.skip, Item.id.label('item_id'), Item.sn, Item.product,
+                   Item.uom, Item.cp, system_quantity.label('system_quantity'), StocktakeLine.counted_quantity,
+                   variance, (variance * Item.cp).label('value'))
+            .join(Item, Item.id == StocktakeLine.item_id)
+            .where(StocktakeLine.stocktake_id == stocktake_id,
+                   StocktakeLine.counted_quantity != system_quantity))
+
+
+def variance_report(stocktake):
+    """Largest variances of a stocktake and totals over all of them"""
+    query = variance_query(stocktake.id, applied=stocktake.status == 'applied').subquery()
+    counted = query.c.skip.is_(False)
+    totals = db.session.execute(
+        select(func.count(),
+               func.sum(case((counted, 1), else_=0)),
+               func.sum(case((and_(counted, query.c.value > 0), query.c.value), else_=0)),
+               func.sum(case((and_(counted, query.c.value < 0), query.c.value), else_=0)))
+    ).one()
+    lines = db.session.execute(
+        select(query).order_by(func.abs(query.c.value).desc(), query.c.sn)
+        .limit(app.config['STOCKTAKE_REPORT_ROWS'])
+    ).all()
+    line_count, unmatched = db.session.execute(
+        select(func.count(), func.sum(case((StocktakeLine.item_id.is_(None), 1), else_=0)))
+        .where(StocktakeLine.stocktake_id == stocktake.id)
+    ).one()
+    return {
+        'lines': lines,
+        'line_count': line_count,
+        'unmatched': unmatched or 0,
+        'variance_count': totals[0],
+        'accepted_count': totals[1] or 0,
+        'gain_value': totals[2] or Decimal('0'),
+        'loss_value': totals[3] or Decimal('0'),
+        'net_value': (totals[2] or Decimal('0')) + (totals[3] or Decimal('0')),
+    }
+
+
+def apply_stocktake(stocktake):
+    """Set the stock of every accepted line to its count in one transaction.
+
+    Returns the number of items adjusted. The caller commits.
+    """
+    accepted = variance_query(stocktake.id).where(StocktakeLine.skip.is_(False))
+    # Lock in id order, like costing.lock_items, so postings and stocktakes queue up
+    changes = db.session.execute(accepted.order_by(Item.id).with_for_update(of=Item)).all()
+
+    accepted_items = select(accepted.subquery().c.item_id)
+
+    if costing.fifo_enabled() and changes:
+        # Shrinkage leaves the cost layers oldest first; surpluses come in at current cost
+        items = {item.id: item for item in Item.query.filter(Item.id.in_(accepted_items))}
+        for row in changes:
+            item = items[row.item_id]
+            if row.variance < 0:
+                costing.issue(item, -row.variance)
+            else:
+                costing.receive(item, row.variance, costing.current_cost(item))
+
+    # Keep what the system said next to what was counted
+    db.session.execute(
+        update(StocktakeLine)
+        .where(StocktakeLine.stocktake_id == stocktake.id, StocktakeLine.item_id.isnot(None))
+        .values(system_quantity=select(Item.current_quantity)
+                .where(Item.id == StocktakeLine.item_id).scalar_subquery())
+    )
+
+    counted = (select(StocktakeLine.counted_quantity)
+               .where(StocktakeLine.stocktake_id == stocktake.id,
+                      StocktakeLine.item_id == Item.id,
+                      StocktakeLine.skip.is_(False))
+               .scalar_subquery())
+    db.session.execute(
+        update(Item)
+        .where(Item.id.in_(accepted_items))
+        .values(current_quantity=counted, updated_at=datetime.utcnow()),
+        execution_options={'synchronize_session': False}
+    )
+
+    stocktake.status = 'applied'
+    stocktake.applied_at = datetime.utcnow()
+
+    threshold = app.config['LOW_STOCK_THRESHOLD']
+    stock = [{'item_id': row.item_id, 'product': row.product, 'current_quantity': float(row.counted_quantity),
+              'uom': row.uom} for row in changes]
+    publish_many('stock', stock)
+    publish_many('low_stock', [payload for payload in stock if payload['current_quantity'] < threshold])
+    publish('stocktake', id=stocktake.id, name=stocktake.name, adjusted=len(changes))
+    record_many('items', [row.item_id for row in changes])
+
+    return len(changes)
@@ -0,0 +1,105 @@
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+from flask import url_for
+from jinja2 import nodes, FileSystemBytecodeCache
+from jinja2.ext import Extension
+
+from app import app
+
+
+class LRUCache:
+    """Small thread-safe mapping that evicts the least recently used key"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FragmentCacheExtension(Extension):
+    """Cache the rendered body of a block under the given key parts.
+
+        {% cache 'item-row', item.id, item.updated_at %} ... {% endcache %}
+
+    Callers include a version (updated_at, document number, ...) in the key,
+    so a changed row renders under a new key and the old one ages out.
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=LRUCache(app.config['FRAGMENT_CACHE_SIZE']))
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_cached', [nodes.List(key)]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, key, caller):
+        key = tuple(key)
+        cache = self.environment.fragment_cache
+        rv = cache.get(key)
+        if rv is None:
+            rv = caller()
+            cache.set(key, rv)
+        return rv
+
+
+@app.template_global()
+def url_prefix(endpoint):
+    """URL of an `<int:id>` endpoint without the id, to build row links once per page"""
+    return url_for(endpoint, id=0)[:-1]
+
+
+app.jinja_env.add_extension(FragmentCacheExtension)
+
+
+def private_directory(path):
+    """Create path if needed and make sure only this user can write to it.
+
+    Bytecode in the cache is loaded and run, so a directory another user
+    created or can write to is refused.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o022:
+        raise RuntimeError(f"Bytecode cache directory {path} must be owned by this user "
+                           f"and not writable by others")
+    return path
+
+
+# Share compiled templates between workers and across restarts. Without a
+# configured directory Jinja uses its own per-user 0700 one in the temp directory.
+if app.config['JINJA_BYTECODE_CACHE_DIR']:
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(private_directory(app.config['JINJA_BYTECODE_CACHE_DIR']))
+else:
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
@@ -2,6 +2,8 @@ import pandas as pd
 from decimal import Decimal
 from app import db
 from models import Item
+from catalog import bump_catalog_version
+from changefeed import record
 import os
 
 def process_excel_file(file_path):
@@ -21,6 +23,7 @@ def process_excel_file(file_path):
         success_count = 0
         error_count = 0
         errors = []
+        imported = []
         
         for index, row in df.iterrows():
             try:
@@ -38,6 +41,7 @@ def process_excel_file(file_path):
                     existing_item.uom = str(row['uom'])
                     existing_item.opening_quantity = Decimal(str(row['opening_quantity']))
                     existing_item.current_quantity = Decimal(str(row['opening_quantity']))
+                    imported.append(existing_item)
                 else:
                     # Create new item
                     new_item = Item(
@@ -53,6 +57,7 @@ def process_excel_file(file_path):
                         current_quantity=Decimal(str(row['opening_quantity']))
                     )
                     db.session.add(new_item)
+                    imported.append(new_item)
                 
                 success_count += 1
                 
@@ -60,7 +65,13 @@ def process_excel_file(file_path):
                 error_count += 1
                 errors.append(f"Row {index + 2}: {str(e)}")
         
+        # Log every imported item for the change feed, after one flush for new ids
+        db.session.flush()
+        for item in imported:
+            record(item)
+        
         # Commit changes
+        bump_catalog_version()
         db.session.commit()
         
         # Clean up uploaded file
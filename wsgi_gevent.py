@@ -0,0 +1,37 @@
+"""Entry point for serving the app with gevent workers (opt-in; needs the
+`gevent` extra).
+
+    gunicorn --bind 0.0.0.0:5000 --worker-class gevent --worker-connections 500 wsgi_gevent:app
+
+Each worker runs every request in a greenlet, so requests waiting on the
+database (API lookups, polls, event streams) don't hold a whole worker.
+gunicorn's gevent worker patches the standard library before this module
+is imported; psycopg2 is made cooperative here. Size the connection pool
+with DB_POOL_SIZE / DB_MAX_OVERFLOW to match the concurrency you expect.
+"""
+import os
+
+try:
+    from gevent import monkey
+except ImportError as e:
+    raise ImportError("Serving with gevent requires the gevent package (install the gevent extra)") from e
+
+# No-op under gunicorn's gevent worker, which has already patched everything;
+# needed when this module is run directly
+monkey.patch_all()
+
+if os.environ.get("DATABASE_URL", "").startswith("postgres"):
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError as e:
+        raise ImportError(
+            "Serving PostgreSQL with gevent requires the psycogreen package (install the gevent extra); "
+            "without it every query blocks the whole worker"
+        ) from e
+    patch_psycopg()
+
+from main import app  # noqa: E402,F401
+
+if __name__ == "__main__":
+    from gevent.pywsgi import WSGIServer
+    WSGIServer(("0.0.0.0", 5000), app).serve_forever()